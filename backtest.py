@@ -0,0 +1,335 @@
+"""週次の銘柄選定ルールを過去の週次スナップショットで再生するバックテスト。
+
+pick_high_yield_stock.py は毎週、選定に使った銘柄表（指数構成銘柄・株価・配当利回り）と
+減配除外フラグを SNAPSHOT_DIR に保存する（save_snapshot）。ここではその列を古い順に
+再生し、毎週 stock_selector.select_stocks（本番と同じ選定ロジック）で銘柄を選んで
+1万円分ずつ買い足したときの、評価額・取得額・予想配当・セクター集中度の推移を返す。
+
+保有は「証券コードの通し番号」で引く NumPy 配列（株数・取得額・直近株価・直近利回り・
+セクター番号）として持ち、毎週その配列を更新するだけで DataFrame は作り直さない。
+選定に渡す保有の集計も配列から HoldingWeights を直接組み立てる。
+
+使い方:
+  python backtest.py                         # SNAPSHOT_DIR の全スナップショットで再生
+  python backtest.py --snapshots DIR --n 2 --lot 10000
+"""
+
+import argparse
+import glob
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from stock_selector import (
+    HEAD_WINDOW,
+    LOT_YEN,
+    PICKS_PER_WEEK,
+    SECTOR_CAP_RATIO,
+    STOCK_CAP_RATIO,
+    TOP_N,
+    CandidateIndex,
+    HoldingWeights,
+    select_stocks,
+)
+
+SNAPSHOT_DIR = "/home/taru-boy/Desktop/get_stock/snapshots"
+CUT_COLUMN = "減配予想"
+
+
+def save_snapshot(df_stocks, cut_codes, date=None, directory=SNAPSHOT_DIR):
+    """
+    その週の銘柄表と減配除外フラグを CSV に保存する（バックテストの入力になる）。
+
+    保存に失敗しても週次実行は止めない（警告のみ）。
+    """
+    date = date or datetime.today().strftime("%Y-%m-%d")
+    df = df_stocks.copy()
+    df[CUT_COLUMN] = df["証券コード"].astype(str).isin({str(c) for c in cut_codes})
+    try:
+        os.makedirs(directory, exist_ok=True)
+        df.to_csv(os.path.join(directory, f"{date}.csv"), index=False, encoding="utf-8")
+    except OSError as e:
+        print(f"[warn] スナップショットを保存できませんでした: {e}")
+
+
+class Snapshot:
+    """
+    1週分の入力。銘柄表・減配除外コード・選定用の索引を持つ。
+
+    Args:
+        date (pd.Timestamp): スナップショットの日付
+        df_stocks (pd.DataFrame): 配当利回り降順の銘柄表
+        cut_codes (set): 減配予想で除外する証券コード（str）
+    """
+
+    def __init__(self, date, df_stocks, cut_codes):
+        self.date = date
+        self.df_stocks = df_stocks
+        self.cut_codes = frozenset(cut_codes)
+        self._candidates = {}
+
+    def candidates(self, head_window=HEAD_WINDOW, top_n=TOP_N):
+        """選定用の CandidateIndex（窓の設定ごとに一度だけ作る）。"""
+        key = (head_window, top_n)
+        if key not in self._candidates:
+            self._candidates[key] = CandidateIndex(
+                self.df_stocks, head_window=head_window, top_n=top_n
+            )
+        return self._candidates[key]
+
+
+def load_snapshots(directory=SNAPSHOT_DIR):
+    """SNAPSHOT_DIR の CSV を日付の古い順に読み込み、Snapshot のリストを返す。"""
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.csv"))):
+        date = pd.Timestamp(os.path.splitext(os.path.basename(path))[0])
+        df = pd.read_csv(path, dtype={"証券コード": str})
+        if CUT_COLUMN in df:
+            cut_codes = set(df.loc[df[CUT_COLUMN].astype(bool), "証券コード"])
+            df = df.drop(columns=[CUT_COLUMN])
+        else:
+            cut_codes = set()
+        df = df.sort_values(by="配当利回り(%)", ascending=False)
+        snapshots.append(Snapshot(date, df, cut_codes))
+    return snapshots
+
+
+class _Universe:
+    """
+    全スナップショットに現れる証券コード・セクターの通し番号と、
+    週ごとの株価・利回りを通し番号に揃えた配列（NaN は当週の表に無い銘柄）。
+    銘柄のセクターは最後に現れた週のものを使う。
+    """
+
+    def __init__(self, snapshots):
+        codes = {}
+        sectors = {}
+        for snapshot in snapshots:
+            for code, sector in zip(
+                snapshot.df_stocks["証券コード"].astype(str),
+                snapshot.df_stocks["セクター"],
+            ):
+                codes.setdefault(code, len(codes))
+                sectors.setdefault(sector, len(sectors))
+        self.code_index = codes
+        self.codes = np.array(list(codes), dtype=object)
+        self.sector_index = sectors
+        self.sectors = np.array(list(sectors), dtype=object)
+
+        size = len(codes)
+        self.prices = []
+        self.yields = []
+        self.code_sectors = np.full(size, -1)
+        for snapshot in snapshots:
+            first = snapshot.df_stocks.drop_duplicates(subset=["証券コード"])
+            slots = np.array(
+                [codes[c] for c in first["証券コード"].astype(str)], dtype=int
+            )
+            price = np.full(size, np.nan)
+            dividend_yield = np.full(size, np.nan)
+            price[slots] = pd.to_numeric(first["株価"], errors="coerce").to_numpy()
+            dividend_yield[slots] = pd.to_numeric(
+                first["配当利回り(%)"], errors="coerce"
+            ).to_numpy()
+            self.code_sectors[slots] = [sectors[s] for s in first["セクター"]]
+            self.prices.append(price)
+            self.yields.append(dividend_yield)
+
+
+class Portfolio:
+    """
+    通し番号で引く配列で持つ保有状態。週ごとの更新は配列演算だけで行う。
+
+    Args:
+        sector (np.ndarray): 通し番号ごとのセクター番号
+        n_sectors (int): セクターの通し番号の数
+    """
+
+    def __init__(self, sector, n_sectors):
+        size = len(sector)
+        self.shares = np.zeros(size)
+        self.cost = np.zeros(size)
+        self.price = np.full(size, np.nan)
+        self.dividend_yield = np.full(size, np.nan)
+        self.sector = sector
+        self.n_sectors = n_sectors
+
+    def mark(self, price, dividend_yield):
+        """当週の表にある銘柄だけ株価・利回りを更新する（無い銘柄は直近値のまま）。"""
+        seen = ~np.isnan(price)
+        self.price[seen] = price[seen]
+        seen_yield = ~np.isnan(dividend_yield)
+        self.dividend_yield[seen_yield] = dividend_yield[seen_yield]
+
+    def buy(self, slot, shares, price):
+        self.shares[slot] += shares
+        self.cost[slot] += shares * price
+
+    def market_caps(self):
+        return np.nan_to_num(self.shares * self.price)
+
+    def sector_caps(self):
+        held = self.shares > 0
+        return np.bincount(
+            self.sector[held], weights=self.market_caps()[held], minlength=self.n_sectors
+        )
+
+    def annual_dividend(self):
+        return float(np.nansum(self.shares * self.price * self.dividend_yield / 100))
+
+    def weights(self, codes, sectors):
+        """選定に渡す HoldingWeights を配列から直接作る。"""
+        held = np.flatnonzero(self.shares > 0)
+        caps = self.market_caps()
+        sector_caps = self.sector_caps()
+        return HoldingWeights(
+            {codes[i]: caps[i] for i in held},
+            {sectors[i]: sector_caps[i] for i in np.flatnonzero(sector_caps)},
+            caps[held].sum(),
+        )
+
+    def held_sectors(self, sectors):
+        held = self.shares > 0
+        return {sectors[i] for i in np.unique(self.sector[held]) if i >= 0}
+
+
+def run_backtest(
+    snapshots,
+    n=PICKS_PER_WEEK,
+    lot=LOT_YEN,
+    head_window=HEAD_WINDOW,
+    top_n=TOP_N,
+    stock_cap_ratio=STOCK_CAP_RATIO,
+    sector_cap_ratio=SECTOR_CAP_RATIO,
+):
+    """
+    スナップショットを古い順に再生し、毎週 select_stocks で選んだ銘柄を買い足す。
+
+    Args:
+        snapshots (list): load_snapshots の戻り値
+        n (int): 毎週選ぶ銘柄数
+        lot (int): 1銘柄あたりの購入額（円、株数は切り上げ）
+        head_window (int): 利回り上位から見る行数（CandidateIndex）
+        top_n (int): 重複排除後に残す銘柄数（CandidateIndex）
+        stock_cap_ratio (float): 保有セクター内選定の1銘柄の上限（全体比）
+        sector_cap_ratio (float): 保有セクター内選定のセクターの上限（全体比）
+
+    Returns:
+        tuple: (path, trades)
+            - path (pd.DataFrame): 週ごとの評価額・取得額・予想年間配当・
+              配当収入（前週からの日割り）・最大セクター比率・HHI・保有銘柄数
+            - trades (pd.DataFrame): 週ごとの購入記録
+    """
+    universe = _Universe(snapshots)
+    portfolio = Portfolio(universe.code_sectors, len(universe.sectors))
+
+    path = []
+    trades = []
+    prev_date = None
+    prev_annual = 0.0
+    for week, snapshot in enumerate(snapshots):
+        portfolio.mark(universe.prices[week], universe.yields[week])
+
+        # 前回からの経過日数で、前回時点の予想年間配当を日割りで受け取ったとみなす
+        income = 0.0
+        if prev_date is not None:
+            income = prev_annual * (snapshot.date - prev_date).days / 365
+
+        weights = portfolio.weights(universe.codes, universe.sectors)
+        picked = select_stocks(
+            snapshot.candidates(head_window, top_n),
+            weights,
+            portfolio.held_sectors(universe.sectors),
+            snapshot.cut_codes,
+            n=n,
+            stock_cap_ratio=stock_cap_ratio,
+            sector_cap_ratio=sector_cap_ratio,
+        )
+        for stock in picked:
+            price = float(stock["株価"])
+            if not price > 0:
+                continue
+            shares = math.ceil(lot / price)
+            code = str(stock["証券コード"])
+            portfolio.buy(universe.code_index[code], shares, price)
+            trades.append(
+                {
+                    "日付": snapshot.date,
+                    "証券コード": code,
+                    "セクター": stock["セクター"],
+                    "株価": price,
+                    "株数": shares,
+                }
+            )
+
+        caps = portfolio.market_caps()
+        total = caps.sum()
+        sector_share = portfolio.sector_caps() / total if total > 0 else np.zeros(1)
+        annual = portfolio.annual_dividend()
+        path.append(
+            {
+                "日付": snapshot.date,
+                "評価額": total,
+                "取得額": portfolio.cost.sum(),
+                "予想年間配当": annual,
+                "配当収入": income,
+                "最大セクター比率": sector_share.max(),
+                "セクターHHI": float((sector_share**2).sum()),
+                "保有銘柄数": int((portfolio.shares > 0).sum()),
+            }
+        )
+        prev_date = snapshot.date
+        prev_annual = annual
+
+    df_path = pd.DataFrame(path)
+    if not df_path.empty:
+        df_path["累積配当収入"] = df_path["配当収入"].cumsum()
+    return df_path, pd.DataFrame(trades)
+
+
+def summarize(df_path):
+    """
+    バックテスト結果の要約（最終週の評価額・取得額・損益・累積配当など）。
+
+    総リターン率 = (評価損益 + 累積配当収入) / 取得額。購入額や銘柄数が違う設定の比較用。
+    """
+    if df_path.empty:
+        return {}
+    last = df_path.iloc[-1]
+    pnl = last["評価額"] - last["取得額"]
+    cost = last["取得額"]
+    return {
+        "週数": len(df_path),
+        "評価額": last["評価額"],
+        "取得額": cost,
+        "評価損益": pnl,
+        "総リターン率": (pnl + last["累積配当収入"]) / cost if cost > 0 else 0.0,
+        "予想年間配当": last["予想年間配当"],
+        "累積配当収入": last["累積配当収入"],
+        "最大セクター比率": df_path["最大セクター比率"].max(),
+        "最終セクターHHI": last["セクターHHI"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshots", default=SNAPSHOT_DIR)
+    parser.add_argument("--n", type=int, default=PICKS_PER_WEEK)
+    parser.add_argument("--lot", type=int, default=LOT_YEN)
+    args = parser.parse_args()
+
+    snapshots = load_snapshots(args.snapshots)
+    if not snapshots:
+        print(f"[error] スナップショットがありません: {args.snapshots}")
+        return
+    df_path, df_trades = run_backtest(snapshots, n=args.n, lot=args.lot)
+    for key, value in summarize(df_path).items():
+        print(f"{key}: {value:,.2f}" if isinstance(value, float) else f"{key}: {value}")
+    print(f"購入回数: {len(df_trades)}")
+
+
+if __name__ == "__main__":
+    main()
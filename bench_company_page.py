@@ -0,0 +1,132 @@
+"""会社ページ抽出のマイクロベンチマーク。
+
+保存済みの会社ページ（HTMLファイルのディレクトリ、または http_cache のキャッシュ）を
+旧実装（html.parser でページ全体を BeautifulSoup 化）と company_page.extract_company_quote
+の両方で解析し、1ページあたりの CPU 時間とピークメモリ、抽出結果の一致を出力する。
+
+使い方:
+  python bench_company_page.py                      # http_cache に溜まった会社ページを使う
+  python bench_company_page.py --fixtures DIR       # DIR/*.html を使う
+  python bench_company_page.py --parser lxml        # 新実装のパーサを切り替える
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import time
+import tracemalloc
+import zlib
+
+from bs4 import BeautifulSoup
+
+from company_page import (
+    NAME_SELECTOR,
+    PRICE_SELECTOR,
+    YIELD_SELECTOR,
+    extract_company_quote,
+    parse_price,
+    parse_yield,
+)
+from http_cache import CACHE_PATH
+from watch_dividend import QUOTE_BASE_URL
+
+
+def legacy_extract(html):
+    """旧 calculate_dividend_yield と同じくページ全体を木にしてから値を引く。"""
+    soup = BeautifulSoup(html, "html.parser")
+    name = soup.select_one(NAME_SELECTOR)
+    price = soup.select_one(PRICE_SELECTOR)
+    dividend = soup.select_one(YIELD_SELECTOR)
+    return (
+        name.text if name is not None else None,
+        parse_price(price.text if price is not None else None),
+        parse_yield(dividend.text if dividend is not None else None),
+    )
+
+
+def fast_extract(html, parser):
+    quote = extract_company_quote(html, parser=parser)
+    return quote.company_name, quote.stock_price, quote.dividend_yield
+
+
+def load_fixtures_from_dir(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def load_fixtures_from_cache(path):
+    if not os.path.exists(path):
+        return []
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT url, body FROM responses WHERE url LIKE ?", (QUOTE_BASE_URL + "%",)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [(url, zlib.decompress(body).decode("utf-8")) for url, body in rows]
+
+
+def measure(func, pages, repeat):
+    """1ページあたりの CPU 時間（ミリ秒）と、1ページ解析中のピークメモリ（KiB）の最大値。"""
+    start = time.process_time()
+    for _ in range(repeat):
+        for _, html in pages:
+            func(html)
+    cpu_ms = (time.process_time() - start) * 1000 / (repeat * len(pages))
+
+    peak = 0
+    for _, html in pages:
+        tracemalloc.start()
+        func(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return cpu_ms, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="会社ページHTMLを置いたディレクトリ")
+    parser.add_argument("--cache", default=CACHE_PATH, help="http_cache のファイル")
+    parser.add_argument("--parser", default="html.parser", help="新実装のパーサ")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.fixtures:
+        pages = load_fixtures_from_dir(args.fixtures)
+    else:
+        pages = load_fixtures_from_cache(args.cache)
+    if not pages:
+        print("[error] ベンチマーク用の会社ページが見つかりません。")
+        return
+
+    mismatches = [
+        name
+        for name, html in pages
+        if legacy_extract(html) != fast_extract(html, args.parser)
+    ]
+
+    legacy_cpu, legacy_mem = measure(legacy_extract, pages, args.repeat)
+    fast_cpu, fast_mem = measure(
+        lambda html: fast_extract(html, args.parser), pages, args.repeat
+    )
+
+    print(f"ページ数: {len(pages)}  繰り返し: {args.repeat}")
+    print(f"{'':<24}{'CPU(ms/page)':>14}{'peak(KiB)':>12}")
+    print(f"{'旧: 全体 html.parser':<24}{legacy_cpu:>14.2f}{legacy_mem:>12.0f}")
+    print(f"{'新: ' + args.parser + ' + strainer':<24}{fast_cpu:>14.2f}{fast_mem:>12.0f}")
+    print(
+        f"CPU {legacy_cpu / fast_cpu:.1f}倍 / メモリ {legacy_mem / fast_mem:.1f}倍 改善"
+    )
+    if mismatches:
+        print(f"[warn] 抽出結果が旧実装と一致しないページ: {mismatches}")
+    else:
+        print("[ok] 全ページで抽出結果が旧実装と一致しました。")
+
+
+if __name__ == "__main__":
+    main()
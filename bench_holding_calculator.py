@@ -0,0 +1,155 @@
+"""保有銘柄集計のマイクロベンチマーク。
+
+合成した購入履歴（既定 10,000 行）から pick_high_yield_stock.py と同じ手順で
+証券コード別の合計株数を作り、旧実装（コードごと・行ごとのマスク、
+sector_order.index による並べ替え）と holding_calculator の実装を比べる。
+株価の取得は行わず、会社ページの代わりに合成した株価表を使う。
+出力は1回あたりの実行時間と、結果（セクター辞書・保有表・セクター順）の一致。
+
+使い方:
+  python bench_holding_calculator.py
+  python bench_holding_calculator.py --rows 50000 --codes 800 --sectors 33
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from holding_calculator import aggregate_holdings, get_holding_sector_dict
+
+
+def legacy_get_holding_sector_dict(df_holding, codes):
+    holding_sector_dict = {}
+    for _code in codes:
+        _sector = df_holding[df_holding["証券コード"] == _code]["セクター"].values[0]
+        holding_sector_dict[_code] = _sector
+    return holding_sector_dict
+
+
+def legacy_aggregate_holdings(df_quotes, df_holding_number):
+    df_latest_holdings = df_quotes.copy()
+
+    df_latest_holdings["合計株数"] = 0
+    for _index, _stock in df_latest_holdings.iterrows():
+        _code = _stock["証券コード"]
+        _matching_row = df_holding_number[df_holding_number["証券コード"] == _code]
+        if not _matching_row.empty:
+            df_latest_holdings.at[_index, "合計株数"] = _matching_row["株数"].values[0]
+
+    df_latest_holdings["時価総額"] = (
+        df_latest_holdings["株価"] * df_latest_holdings["合計株数"]
+    ).astype(int)
+    sector_total_market_cap = (
+        df_latest_holdings.groupby("セクター")["時価総額"]
+        .sum()
+        .sort_values(ascending=False)
+    )
+    sector_order = sector_total_market_cap.index.tolist()
+    df_latest_holdings["セクター順序"] = df_latest_holdings["セクター"].apply(
+        lambda x: sector_order.index(x)
+    )
+    df_latest_holdings = df_latest_holdings.sort_values(
+        by=["セクター順序", "時価総額"], ascending=[True, False]
+    )
+    df_latest_holdings.drop(columns=["セクター順序"], inplace=True)
+    return df_latest_holdings, sector_order
+
+
+def make_ledger(rows, n_codes, n_sectors, seed=0):
+    """購入履歴シート相当の表（文字列で読んだものを数値化した後の形）を作る。"""
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(np.arange(1300, 9999), size=n_codes, replace=False)
+    sectors = np.array([f"セクター{i:02d}" for i in range(n_sectors)])
+    code_sector = dict(zip(codes, rng.choice(sectors, size=n_codes)))
+    picked = rng.choice(codes, size=rows)
+    prices = rng.uniform(300, 8000, size=rows).round(1)
+    return pd.DataFrame(
+        {
+            "日付": pd.date_range("2015-01-01", periods=rows, freq="h").strftime(
+                "%Y-%m-%d"
+            ),
+            "証券コード": picked,
+            "セクター": [code_sector[code] for code in picked],
+            "取得単価": prices,
+            "株数": np.ceil(10000 / prices).astype(int),
+        }
+    )
+
+
+def make_quotes(codes, holding_sector_dict, seed=0):
+    """calculate_dividend_yield の戻り値（URL列を除いたもの）相当の表を作る。"""
+    rng = np.random.default_rng(seed + 1)
+    df = pd.DataFrame(
+        {
+            "証券コード": codes,
+            "セクター": [holding_sector_dict[code] for code in codes],
+            "配当利回り(%)": rng.uniform(1, 6, size=len(codes)).round(2),
+            "会社名": [f"会社{code}" for code in codes],
+            "株価": rng.uniform(300, 8000, size=len(codes)).round(1),
+        }
+    )
+    return df.sort_values(by="配当利回り(%)", ascending=False)
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--codes", type=int, default=400)
+    parser.add_argument("--sectors", type=int, default=33)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df_holding = make_ledger(args.rows, args.codes, args.sectors)
+    df_holding_number = df_holding.groupby("証券コード", as_index=False)["株数"].sum()
+    codes = list(df_holding["証券コード"].unique())
+
+    legacy_dict_ms, legacy_dict = timed(
+        lambda: legacy_get_holding_sector_dict(df_holding, codes), args.repeat
+    )
+    fast_dict_ms, fast_dict = timed(
+        lambda: get_holding_sector_dict(df_holding, codes), args.repeat
+    )
+
+    df_quotes = make_quotes(codes, fast_dict)
+    legacy_agg_ms, (legacy_df, legacy_order) = timed(
+        lambda: legacy_aggregate_holdings(df_quotes, df_holding_number), args.repeat
+    )
+    fast_agg_ms, (fast_df, fast_order) = timed(
+        lambda: aggregate_holdings(df_quotes, df_holding_number), args.repeat
+    )
+
+    print(f"購入履歴: {args.rows} 行 / 銘柄: {len(codes)} / 繰り返し: {args.repeat}")
+    print(f"{'':<28}{'旧(ms)':>10}{'新(ms)':>10}{'倍率':>8}")
+    for label, legacy_ms, fast_ms in (
+        ("get_holding_sector_dict", legacy_dict_ms, fast_dict_ms),
+        ("合計株数・並べ替え", legacy_agg_ms, fast_agg_ms),
+    ):
+        print(
+            f"{label:<28}{legacy_ms:>10.1f}{fast_ms:>10.1f}"
+            f"{legacy_ms / fast_ms:>8.1f}"
+        )
+
+    mismatches = []
+    if legacy_dict != fast_dict:
+        mismatches.append("セクター辞書")
+    if not legacy_df.equals(fast_df) or list(legacy_df.index) != list(fast_df.index):
+        mismatches.append("保有表")
+    if legacy_order != fast_order:
+        mismatches.append("セクター順")
+    if mismatches:
+        print(f"[warn] 旧実装と一致しない結果: {mismatches}")
+    else:
+        print("[ok] セクター辞書・保有表・セクター順が旧実装と一致しました。")
+
+
+if __name__ == "__main__":
+    main()
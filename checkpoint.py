@@ -0,0 +1,103 @@
+"""週次処理のステージの結果を、実行日ごとのディレクトリに残すチェックポイント。
+
+150ページの取得が終わった後のシート書き込みなどで落ちても、同じ日の再実行
+（--resume）では保存済みのステージを読み込んで飛ばし、残りだけを実行する。
+保存するのは構成銘柄・銘柄表・保有の時価総額・減配除外・選定結果などの
+ステージの戻り値で、DataFrame をそのまま持てるよう pickle で書く
+（一時ファイルに書いてから os.replace で置き換える）。
+
+日付が変われば別のディレクトリになるので、翌週の実行が前週の結果を読むことはない。
+読めないファイルは無いものとして扱い、そのステージは実行し直す。
+"""
+
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime
+
+CHECKPOINT_DIR = "/home/taru-boy/Desktop/get_stock/checkpoints"
+KEEP_RUNS = 8  # 残しておく実行日の数（古いものから消す）
+SUFFIX = ".pkl"
+
+
+class CheckpointStore:
+    """
+    1回の実行日のステージ結果を保存・読み込みする。
+
+    Args:
+        run_date (str): 実行日（YYYY-MM-DD）。省略時は今日
+        root (str): 実行日ごとのディレクトリを作る場所
+    """
+
+    def __init__(self, run_date=None, root=CHECKPOINT_DIR):
+        self.run_date = run_date or datetime.today().strftime("%Y-%m-%d")
+        self.root = root
+        self.directory = os.path.join(root, self.run_date)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def has(self, name):
+        return os.path.exists(self._path(name))
+
+    def save(self, name, value):
+        """ステージの結果を保存する（保存に失敗しても処理は止めない）。"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(name) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(name))
+        except Exception as e:  # 保存できなくても実行は続ける
+            logging.warning(f"Could not save checkpoint {name}: {e}")
+
+    def load(self, names):
+        """
+        保存済みのステージ結果を読み込む。
+
+        Args:
+            names (iterable): 読み込みたいステージ名
+
+        Returns:
+            dict: 読み込めたステージ名 → 結果
+        """
+        results = {}
+        for name in names:
+            if not self.has(name):
+                continue
+            try:
+                with open(self._path(name), "rb") as f:
+                    results[name] = pickle.load(f)
+            except Exception as e:  # 壊れていたらそのステージは実行し直す
+                logging.warning(f"Ignoring unreadable checkpoint {name}: {e}")
+        return results
+
+    def wrap(self, name, func, save_if=None):
+        """
+        func(**kwargs) の結果を name として保存してから返す関数にする。
+
+        save_if を渡すと、save_if(結果) が真の時だけ保存する（失敗した結果を残さない用）。
+        """
+
+        def wrapper(**kwargs):
+            result = func(**kwargs)
+            if save_if is None or save_if(result):
+                self.save(name, result)
+            return result
+
+        return wrapper
+
+    def prune(self, keep=KEEP_RUNS):
+        """実行日のディレクトリを新しい方から keep 個だけ残して消す。"""
+        try:
+            dates = sorted(
+                entry
+                for entry in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, entry))
+            )
+        except FileNotFoundError:
+            return
+        for entry in dates[:-keep] if keep else dates:
+            if entry != self.run_date:
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
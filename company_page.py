@@ -0,0 +1,83 @@
+"""nikkei.com の会社ページから会社名・株価・配当利回りだけを取り出す抽出器。
+
+会社ページで実際に読むのは「会社名の h1」「株価の dd」「配当利回りの span」の3か所だけ。
+ページ全体の木を組み立てる代わりに SoupStrainer で対象クラスを持つ要素（とその子孫）
+だけを木にして、そこから同じ CSS セレクタで値を引く。
+
+効果は bench_company_page.py で保存済みのページを使って旧実装と比較できる。
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+NAME_SELECTOR = "h1.m-headlineLarge_text"
+PRICE_SELECTOR = "dd.m-stockPriceElm_value"
+YIELD_SELECTOR = (
+    "div.m-stockInfo_detail_right li:nth-child(3) span.m-stockInfo_detail_value"
+)
+
+# 上の3セレクタの起点になる要素のクラス。これ以外の要素は木に入れない。
+_TARGET_CLASSES = re.compile(
+    r"(?:^|\s)(m-headlineLarge_text|m-stockPriceElm_value|m-stockInfo_detail_right)"
+    r"(?:\s|$)"
+)
+_STRAINER = SoupStrainer(class_=_TARGET_CLASSES)
+
+_PRICE_PATTERN = re.compile(r"[\d,]+")
+_YIELD_PATTERN = re.compile(r"(\d+(\.\d+)?)")
+
+
+class CompanyQuote(NamedTuple):
+    """会社ページから取り出した値。取れなかった項目は None。"""
+
+    company_name: Optional[str]
+    stock_price: Optional[float]
+    dividend_yield: Optional[float]
+    price_text: Optional[str]
+    yield_text: Optional[str]
+
+
+def _select_text(soup, selector):
+    node = soup.select_one(selector)
+    return node.text if node is not None else None
+
+
+def parse_price(text):
+    """'1,234 円' のような株価表記を float にする。数字が無ければ None。"""
+    if text is None:
+        return None
+    match = _PRICE_PATTERN.search(text)
+    return float(match.group().replace(",", "")) if match else None
+
+
+def parse_yield(text):
+    """'3.45%' のような利回り表記を float にする。数字が無ければ None。"""
+    if text is None:
+        return None
+    match = _YIELD_PATTERN.search(text)
+    return float(match.group()) if match else None
+
+
+def extract_company_quote(html, parser="html.parser"):
+    """
+    会社ページのHTMLから CompanyQuote を返す。
+
+    Args:
+        html (str): 会社ページのHTML
+        parser (str): BeautifulSoup のパーサ名（lxml が入っていれば "lxml" も可）
+
+    Returns:
+        CompanyQuote: 会社名・株価・配当利回りと、その元の表記
+    """
+    soup = BeautifulSoup(html, parser, parse_only=_STRAINER)
+    price_text = _select_text(soup, PRICE_SELECTOR)
+    yield_text = _select_text(soup, YIELD_SELECTOR)
+    return CompanyQuote(
+        company_name=_select_text(soup, NAME_SELECTOR),
+        stock_price=parse_price(price_text),
+        dividend_yield=parse_yield(yield_text),
+        price_text=price_text,
+        yield_text=yield_text,
+    )
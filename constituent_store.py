@@ -0,0 +1,122 @@
+"""指数構成銘柄リストをローカルに保存し、入れ替え（リバランス）までは再取得しないストア。
+
+nk225hdy / nkphd / nkcdg の構成銘柄は定期的な入れ替えの時しか変わらない。
+指数ごとに「構成銘柄・セクター・内容ハッシュ・版数・最終確認日時」を JSON に持ち、
+最終確認から revalidate_days 以内ならスクレイピングを省く。
+取り直して内容が変わっていれば版数を上げ、追加・除外された銘柄を履歴に残す。
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+STORE_PATH = "/home/taru-boy/Desktop/get_stock/cache/constituents.json"
+REVALIDATE_DAYS = 28  # 最終確認からこの日数が経つまでは取り直さない
+HISTORY_LIMIT = 50  # 指数ごとに残す入れ替え履歴の件数
+
+
+def content_hash(codes, sector_dict):
+    """
+    構成銘柄とセクターから内容ハッシュを作る。
+
+    ページ上の並び順だけが変わっても同じ値になるよう、(証券コード, セクター) の組を
+    並べ替えてからハッシュする。
+    """
+    pairs = sorted({(code, sector_dict.get(code) or "") for code in codes})
+    payload = json.dumps(pairs, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ConstituentStore:
+    """
+    指数ごとの構成銘柄を版数・内容ハッシュ付きで保存する JSON ストア。
+
+    Args:
+        path (str): 保存先の JSON ファイル
+        revalidate_days (float): 最終確認からこの日数以内ならキャッシュを使う
+    """
+
+    def __init__(self, path=STORE_PATH, revalidate_days=REVALIDATE_DAYS):
+        self.path = path
+        self.revalidate_days = revalidate_days
+        self._data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            # 壊れていたら作り直す（取り直せば復元できるデータなので）
+            return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get_fresh(self, index_id, now=None):
+        """
+        最終確認から revalidate_days 以内なら (codes, sector_dict) を返す。
+        古い・未保存なら None。
+        """
+        entry = self._data.get(index_id)
+        if not entry:
+            return None
+        now = now or datetime.now()
+        checked_at = datetime.fromisoformat(entry["checked_at"])
+        if now - checked_at > timedelta(days=self.revalidate_days):
+            return None
+        return list(entry["codes"]), dict(entry["sectors"])
+
+    def update(self, index_id, codes, sector_dict, now=None):
+        """
+        取り直した構成銘柄を保存し、入れ替えがあればその差分を返す。
+
+        Returns:
+            dict | None: 内容が変わった場合は
+                {"version", "added", "removed", "date"}。初回保存・変化なしは None。
+        """
+        now = now or datetime.now()
+        sectors = {code: sector_dict.get(code) for code in codes}
+        digest = content_hash(codes, sectors)
+        entry = self._data.get(index_id)
+
+        diff = None
+        if entry is None:
+            entry = {"version": 1, "history": []}
+        # 保存済みの内容からハッシュを作り直して比べる（ハッシュの作り方が変わっても、
+        # 中身が同じなら入れ替えとして扱わない）
+        elif content_hash(entry["codes"], entry["sectors"]) != digest:
+            old = set(entry["codes"])
+            new = set(codes)
+            diff = {
+                "version": entry["version"] + 1,
+                "date": now.strftime("%Y-%m-%d"),
+                "added": sorted(new - old),
+                "removed": sorted(old - new),
+            }
+            entry["version"] = diff["version"]
+            entry["history"] = (entry.get("history", []) + [diff])[-HISTORY_LIMIT:]
+
+        entry.update(
+            {
+                "hash": digest,
+                "codes": list(codes),
+                "sectors": sectors,
+                "checked_at": now.isoformat(timespec="seconds"),
+            }
+        )
+        self._data[index_id] = entry
+        self._save()
+        return diff
+
+    def history(self, index_id):
+        """入れ替え履歴（古い順）を返す。"""
+        return list(self._data.get(index_id, {}).get("history", []))
@@ -1,44 +1,92 @@
+import json
 import logging
 import os
+from datetime import datetime, timedelta
 
+import numpy as np
+import pandas as pd
 import requests
-from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.ERROR, filename="error.log")
-
-load_dotenv(dotenv_path="/home/taru-boy/Desktop/get_stock/.env")
+from http_fetcher import RateLimitedFetcher
+from instrumentation import span
 
 BASE_URL = "https://edinetdb.jp/v1"
-API_KEY = os.getenv("EDINETDB_API_KEY")
+# API キーは環境変数 EDINETDB_API_KEY（呼び出し側で load_dotenv 済みの前提）
+API_KEY_ENV = "EDINETDB_API_KEY"
 TIMEOUT = 20
 
+# 証券コード→EDINETコードの対応表のキャッシュ（全企業一覧は毎回取るには大きい）
+CODE_MAP_PATH = "/home/taru-boy/Desktop/get_stock/cache/edinet_code_map.json"
+CODE_MAP_TTL_DAYS = 30  # この日数が経ったら条件付きGETで再検証する
+CODE_MAP_RETRY_HOURS = 24  # 未解決コードがあっても、この時間内は取り直さない
 
-def _headers():
-    return {"X-API-Key": API_KEY}
+# earnings 取得の並列度とレート（EDINET DB のレート制限に合わせて調整する）
+EARNINGS_RATE = 2.0  # 毎秒リクエスト数
+EARNINGS_MAX_WORKERS = 4
+EARNINGS_RETRIES = 3  # 429 / 5xx 時の再試行回数（指数バックオフ）
+EARNINGS_BACKOFF = 1.0
 
+# earnings の判定材料のキャッシュ（新しい決算短信が出るまで中身は変わらない）
+EARNINGS_STORE_PATH = "/home/taru-boy/Desktop/get_stock/cache/edinet_earnings.json"
+# 最後の取得からこの日数が経ったら取り直す（週次実行の4回に1回。
+# earnings の応答には開示日の項目が確認できないので、短信の開示に合わせず一律の期限にする）
+EARNINGS_TTL_DAYS = 27
 
-def build_code_map():
-    """
-    EDINET DBの全企業一覧を1リクエストで取得し、証券コード→EDINETコードの辞書を返す。
 
-    sec_codeは「4桁ティッカー+0」の5桁文字列（例: 三菱商事 8058 -> "80580"）。
-    本システムの証券コードは4桁なので、4桁キーで引けるようにする。
+def _api_key():
+    return os.getenv(API_KEY_ENV)
 
-    Returns:
-        dict: {"8058": "E02529", ...} 形式。取得失敗時は空辞書。
+
+def _headers():
+    return {"X-API-Key": _api_key()}
+
+
+def create_edinet_fetcher(
+    rate=EARNINGS_RATE,
+    max_workers=EARNINGS_MAX_WORKERS,
+    retries=EARNINGS_RETRIES,
+    backoff=EARNINGS_BACKOFF,
+):
+    """EDINET DB 用の取得器（共有セッション・レート制限・429/5xx 再試行付き）を作る。"""
+    return RateLimitedFetcher(
+        rate=rate,
+        max_workers=max_workers,
+        headers=_headers(),
+        timeout=TIMEOUT,
+        retries=retries,
+        backoff=backoff,
+    )
+
+
+def _fetch_code_map(etag=None, last_modified=None):
     """
-    try:
+    全企業一覧を取得して (code_map, validators) を返す。
+
+    etag / last_modified を渡すと条件付きGETにし、304 (Not Modified) なら
+    code_map は None を返す（手元の対応表をそのまま使ってよい）。
+    取得失敗時は例外（requests.RequestException / ValueError）を投げる。
+    """
+    headers = _headers()
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    with span("http", "edinet:companies") as http_span:
         r = requests.get(
             f"{BASE_URL}/companies",
-            headers=_headers(),
+            headers=headers,
             params={"per_page": 5000},
             timeout=TIMEOUT,
         )
-        r.raise_for_status()
-        rows = r.json().get("data", [])
-    except (requests.RequestException, ValueError) as e:
-        logging.error(f"EDINET build_code_map failed: {e}")
-        return {}
+        http_span.add(requests=1, nbytes=len(r.content))
+    validators = {
+        "etag": r.headers.get("ETag") or etag,
+        "last_modified": r.headers.get("Last-Modified") or last_modified,
+    }
+    if r.status_code == 304:
+        return None, validators
+    r.raise_for_status()
+    rows = r.json().get("data", [])
 
     code_map = {}
     for row in rows:
@@ -48,7 +96,111 @@ def build_code_map():
             continue
         # 5桁sec_code("80580")の先頭4桁を4桁ティッカーのキーにする
         code_map[str(sec_code)[:4]] = edinet_code
-    return code_map
+    return code_map, validators
+
+
+def _read_code_map_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        cached["fetched_at"] = datetime.fromisoformat(cached["fetched_at"])
+        return cached
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_code_map_cache(path, code_map, validators, fetched_at, unresolved=()):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        # 起動時に一瞬で読めるよう、空白なしの1行JSONで保存する
+        json.dump(
+            {
+                "fetched_at": fetched_at.isoformat(timespec="seconds"),
+                "etag": validators.get("etag"),
+                "last_modified": validators.get("last_modified"),
+                "map": code_map,
+                "unresolved": sorted(unresolved),
+            },
+            f,
+            separators=(",", ":"),
+        )
+    os.replace(tmp_path, path)
+
+
+def load_code_map(codes=(), path=CODE_MAP_PATH, ttl_days=CODE_MAP_TTL_DAYS):
+    """
+    証券コード→EDINETコードの対応表を、ローカルのキャッシュ優先で返す。
+
+    対応表はほぼ変わらないため、取得から ttl_days 以内はキャッシュをそのまま使う。
+    期限切れなら条件付きGET（ETag / Last-Modified）で再検証し、変わっていなければ
+    本体を取り直さない。codes に対応表で引けないコードがあれば、新規上場などで
+    表が古い可能性があるため、最後の取得から CODE_MAP_RETRY_HOURS 以上経っていれば
+    1度だけ取り直す。取り直しても引けなかったコード（REIT・上場廃止など）は
+    キャッシュに「未解決」として残し、次回以降はそれだけでは取り直さない
+    （未解決の記録は対応表の期限切れで取り直した時に見直す）。
+    取得に失敗した場合は古いキャッシュでも使う（fail-open）。
+
+    Args:
+        codes (list): これから引く証券コード（未解決の検出用。省略可）
+        path (str): キャッシュファイルのパス
+        ttl_days (float): キャッシュの有効日数
+
+    Returns:
+        dict: {"8058": "E02529", ...} 形式。取得もキャッシュも無ければ空辞書。
+    """
+    now = datetime.now()
+    cached = _read_code_map_cache(path)
+
+    def refresh(cached):
+        validators = {}
+        if cached and cached.get("map"):
+            validators = {
+                "etag": cached.get("etag"),
+                "last_modified": cached.get("last_modified"),
+            }
+        try:
+            code_map, validators = _fetch_code_map(**validators)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"EDINET code map refresh failed: {e}")
+            return cached
+        if code_map is None:
+            code_map = cached["map"]
+        return {"fetched_at": now, "map": code_map, "unresolved": [], **validators}
+
+    known_unresolved = set(cached.get("unresolved", [])) if cached else set()
+    attempted = False
+    if cached is None or now - cached["fetched_at"] > timedelta(days=ttl_days):
+        cached = refresh(cached)
+        attempted = True
+    if cached is None:
+        return {}
+
+    unresolved = {str(code) for code in codes if str(code) not in cached["map"]}
+    new_unresolved = sorted(unresolved - known_unresolved)
+    if (
+        new_unresolved
+        and not attempted
+        and now - cached["fetched_at"] > timedelta(hours=CODE_MAP_RETRY_HOURS)
+    ):
+        logging.error(f"EDINET code map refresh for unresolved codes: {new_unresolved}")
+        cached = refresh(cached)
+        unresolved = {str(code) for code in codes if str(code) not in cached["map"]}
+
+    refreshed = cached["fetched_at"] == now
+    if refreshed:
+        # 取り直した表で引けるようになったコードは未解決から外す
+        known_unresolved = {c for c in known_unresolved if c not in cached["map"]}
+    still_unresolved = known_unresolved | unresolved
+    if refreshed or still_unresolved != set(cached.get("unresolved", [])):
+        _write_code_map_cache(
+            path,
+            cached["map"],
+            {"etag": cached.get("etag"), "last_modified": cached.get("last_modified")},
+            cached["fetched_at"],
+            still_unresolved,
+        )
+    return cached["map"]
 
 
 # 一般的な株式分割比（forecast/actual がこれに近い場合は分割の可能性が高い）。
@@ -132,12 +284,30 @@ def _exceeds_full_payout(forecast_dividend, forecast_eps):
     return forecast_dividend / forecast_eps > 1.0
 
 
-def _is_dividend_cut(edinet_code):
+def _fetch_earnings(edinet_code, fetcher=None):
+    """
+    決算短信(earnings)の配列（新しい順）を取得する。エラー時は None。
     """
-    決算短信(earnings)から、来期予想が減配かつ予想配当性向>100%かを判定する。
+    url = f"{BASE_URL}/companies/{edinet_code}/earnings"
+    try:
+        if fetcher is not None:
+            r = fetcher.get(url)
+        else:
+            with span("http", "edinet:earnings") as http_span:
+                r = requests.get(url, headers=_headers(), timeout=TIMEOUT)
+                http_span.add(requests=1, nbytes=len(r.content))
+        r.raise_for_status()
+        return r.json().get("data", {}).get("earnings", [])
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"EDINET earnings fetch failed for {edinet_code}: {e}")
+        return None
+
 
-    earnings.dataは新しい順の配列。_latest_dividendsで最新の実績と予想を別々に
-    拾い比較する（当期通期予想は直近確定実績の翌期に一致しYoYで整合する）。
+def _judge_dividends(actual, forecast, actual_is_adjusted, forecast_eps):
+    """
+    _latest_dividends の結果から、来期予想が減配かつ予想配当性向>100%かを判定する。
+
+    最新の実績と予想を比較する（当期通期予想は直近確定実績の翌期に一致しYoYで整合する）。
     分割調整後の実績を採れた場合はそのまま比較し、生値にフォールバックした場合のみ
     予想が分割後ベースと推定されるか（_looks_like_split）をチェックして誤検知を防ぐ。
 
@@ -145,23 +315,12 @@ def _is_dividend_cut(edinet_code):
     配当を賄えない）」の両方を満たす場合のみ。市況ピークからの正常化や下限着地など、
     減配でも配当が利益でカバーできている銘柄は除外しない。
 
+    screen_dividend_cuts はこの規則を配列演算でまとめて適用する。
+
     Returns:
-        bool: 減配かつ性向>100%ならTrue。判定不能・未開示・分割推定・エラー時は
+        bool: 減配かつ性向>100%ならTrue。判定不能・未開示・分割推定は
               False（fail-open）。
     """
-    try:
-        r = requests.get(
-            f"{BASE_URL}/companies/{edinet_code}/earnings",
-            headers=_headers(),
-            timeout=TIMEOUT,
-        )
-        r.raise_for_status()
-        earnings = r.json().get("data", {}).get("earnings", [])
-    except (requests.RequestException, ValueError) as e:
-        logging.error(f"EDINET earnings fetch failed for {edinet_code}: {e}")
-        return False
-
-    actual, forecast, actual_is_adjusted, forecast_eps = _latest_dividends(earnings)
     if actual is None or forecast is None:
         return False
     if not actual_is_adjusted and _looks_like_split(actual, forecast):
@@ -171,34 +330,235 @@ def _is_dividend_cut(edinet_code):
     return _exceeds_full_payout(forecast, forecast_eps)
 
 
-def get_dividend_cut_codes(codes):
+class EarningsStore:
     """
-    指定証券コードのうち、来期配当予想が減配の銘柄コードのset（文字列）を返す。
+    EDINETコードごとに、earnings の判定材料と取得履歴を保存する JSON ストア。
 
-    選定アルゴリズムが実際に評価する候補集合のみを渡すことを想定（レート節約）。
-    コード未解決・APIエラー・予想未開示の銘柄は除外せずスキップする（fail-open）。
+    決算短信の中身は新しい短信が出た時にしか変わらないため、各社について
+    「最後に取得した日時」と「_latest_dividends の結果」を持ち、最後の取得から
+    EARNINGS_TTL_DAYS 経った銘柄（is_due）だけを取り直す。
+    予想の修正は最大で EARNINGS_TTL_DAYS 遅れて反映される
+    （すぐに反映したい時は use_cache=False で全銘柄を取り直す）。
+
+    Args:
+        path (str): 保存先の JSON ファイル
+    """
+
+    def __init__(self, path=EARNINGS_STORE_PATH):
+        self.path = path
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def is_due(self, edinet_code, now=None):
+        entry = self._data.get(edinet_code)
+        if entry is None:
+            return True
+        now = now or datetime.now()
+        fetched_at = datetime.fromisoformat(entry["fetched_at"])
+        return now - fetched_at > timedelta(days=EARNINGS_TTL_DAYS)
+
+    def get_dividends(self, edinet_code):
+        """保存済みの _latest_dividends の結果（タプル）。無ければ None。"""
+        entry = self._data.get(edinet_code)
+        return tuple(entry["dividends"]) if entry else None
+
+    def put(self, edinet_code, earnings, now=None):
+        """取得した earnings から判定材料を保存し、_latest_dividends の結果を返す。"""
+        now = now or datetime.now()
+        dividends = _latest_dividends(earnings)
+        self._data[edinet_code] = {
+            "fetched_at": now.isoformat(timespec="seconds"),
+            "dividends": list(dividends),
+        }
+        return dividends
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+
+DIVIDEND_COLUMNS = ["actual", "forecast", "actual_is_adjusted", "forecast_eps"]
+
+
+def screen_dividend_cuts(df_dividends):
+    """
+    _latest_dividends の結果を並べた表から、減配判定を配列演算でまとめて行う。
+
+    _judge_dividends（1社ずつの判定）と同じ規則を NumPy の配列演算で表したもの。
+    候補集合だけでなく3指数＋保有銘柄の全体を一度に判定しても Python のループを回さない。
+
+    Args:
+        df_dividends (pd.DataFrame): 行が銘柄、列が DIVIDEND_COLUMNS
+            （actual, forecast, actual_is_adjusted, forecast_eps。欠損は None/NaN）
+
+    Returns:
+        pd.DataFrame: 入力に以下の列を加えた表（行の並びとインデックスは入力のまま）
+            - is_split: 生値の実績と予想の比が分割比に近い（分割と推定）
+            - is_decrease: 予想 < 実績
+            - exceeds_payout: 予想配当性向 > 100%（予想EPS<=0 で配当ありも含む）
+            - is_cut: 除外対象（減配かつ性向>100%、判定不能・分割推定は False）
+            - reason: 判定理由
+    """
+    df = df_dividends.copy()
+    actual = pd.to_numeric(df["actual"], errors="coerce").to_numpy(dtype=float)
+    forecast = pd.to_numeric(df["forecast"], errors="coerce").to_numpy(dtype=float)
+    eps = pd.to_numeric(df["forecast_eps"], errors="coerce").to_numpy(dtype=float)
+    adjusted = df["actual_is_adjusted"].eq(True).to_numpy()
+
+    missing = np.isnan(actual) | np.isnan(forecast)
+
+    # _looks_like_split: 実績>0 で forecast/actual が分割比のどれかに近い
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(actual > 0, forecast / actual, np.nan)
+        ratios = np.asarray(_SPLIT_RATIOS)
+        near = np.abs(ratio[:, None] - ratios[None, :]) / ratios[None, :]
+    is_split = (
+        ~missing & ~adjusted & (actual > 0) & (near <= _SPLIT_TOLERANCE).any(axis=1)
+    )
+
+    is_decrease = ~missing & (forecast < actual)
+
+    # _exceeds_full_payout: EPS未開示は False、EPS<=0 は配当>0 なら True
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payout = np.where(eps > 0, forecast / eps, np.nan)
+    has_eps = ~np.isnan(eps)
+    exceeds_payout = has_eps & np.where(eps <= 0, forecast > 0, payout > 1.0)
+
+    is_cut = ~missing & ~is_split & is_decrease & exceeds_payout
+
+    reason = np.select(
+        [missing, is_split, ~is_decrease, ~has_eps, ~exceeds_payout],
+        [
+            "判定不能（実績または予想が未開示）",
+            "株式分割と推定",
+            "減配予想なし",
+            "減配予想だが予想EPS未開示",
+            "減配予想だが配当性向100%以内",
+        ],
+        default="減配予想かつ配当性向100%超",
+    )
+
+    df["is_split"] = is_split
+    df["is_decrease"] = is_decrease
+    df["exceeds_payout"] = exceeds_payout
+    df["is_cut"] = is_cut
+    df["reason"] = reason
+    return df
+
+
+def get_dividend_cut_table(
+    codes, fetcher=None, use_cache=True, code_map_path=CODE_MAP_PATH
+):
+    """
+    指定証券コードの判定材料を集め、screen_dividend_cuts で判定した表を返す。
+
+    コード未解決・APIエラーで判定材料が無い銘柄は表に含めない（fail-open）。
+    earnings は共有セッションで並列に取得し、全体のリクエスト数は EARNINGS_RATE
+    で制限する（429 / 5xx は指数バックオフで再試行）。
+    use_cache=True なら EarningsStore で EARNINGS_TTL_DAYS を過ぎた銘柄だけを取り直し、
+    それ以外は保存済みの判定材料で判定する（取得に失敗した銘柄も保存済みがあれば使う）。
 
     Args:
         codes (list): 証券コードのリスト（int/str混在可）
+        fetcher (RateLimitedFetcher): 共有の取得器。省略時は create_edinet_fetcher()
+        use_cache (bool): EarningsStore を使うか
+        code_map_path (str): 証券コード→EDINETコードの対応表のキャッシュ
 
     Returns:
-        set: 減配と判定された証券コードの集合（str）
+        pd.DataFrame: 証券コード（str）をインデックスとする判定表
+            （列は edinet_code, DIVIDEND_COLUMNS と screen_dividend_cuts の判定列）
     """
-    if not API_KEY:
+    empty = screen_dividend_cuts(
+        pd.DataFrame(columns=["edinet_code"] + DIVIDEND_COLUMNS)
+    )
+    if not _api_key():
         logging.error("EDINET get_dividend_cut_codes skipped: EDINETDB_API_KEY未設定")
-        return set()
+        return empty
 
-    code_map = build_code_map()
+    code_map = load_code_map(codes, path=code_map_path)
     if not code_map:
-        return set()
+        return empty
 
-    cut_codes = set()
+    targets = []
     for code in codes:
         code_str = str(code)
         edinet_code = code_map.get(code_str)
         if edinet_code is None:
             logging.error(f"EDINET code unresolved: {code_str}")
             continue
-        if _is_dividend_cut(edinet_code):
-            cut_codes.add(code_str)
-    return cut_codes
+        targets.append((code_str, edinet_code))
+
+    store = EarningsStore() if use_cache else None
+    now = datetime.now()
+    due = [
+        edinet_code
+        for _, edinet_code in targets
+        if store is None or store.is_due(edinet_code, now)
+    ]
+
+    fetched = []
+    if due:
+        if fetcher is None:
+            fetcher = create_edinet_fetcher()
+        fetched = fetcher.map(
+            lambda edinet_code: _fetch_earnings(edinet_code, fetcher), due
+        )
+
+    dividends = {}
+    for edinet_code, earnings in zip(due, fetched):
+        if earnings is None:
+            continue
+        if store is not None:
+            dividends[edinet_code] = store.put(edinet_code, earnings, now)
+        else:
+            dividends[edinet_code] = _latest_dividends(earnings)
+    if store is not None:
+        if due:
+            store.save()
+        for _, edinet_code in targets:
+            if edinet_code not in dividends:
+                cached = store.get_dividends(edinet_code)
+                if cached is not None:
+                    dividends[edinet_code] = cached
+
+    rows = [
+        [code_str, edinet_code, *dividends[edinet_code]]
+        for code_str, edinet_code in targets
+        if edinet_code in dividends
+    ]
+    if not rows:
+        return empty
+    df = pd.DataFrame(rows, columns=["証券コード", "edinet_code"] + DIVIDEND_COLUMNS)
+    df = df.drop_duplicates(subset=["証券コード"]).set_index("証券コード")
+    return screen_dividend_cuts(df)
+
+
+def get_dividend_cut_codes(
+    codes, fetcher=None, use_cache=True, code_map_path=CODE_MAP_PATH
+):
+    """
+    指定証券コードのうち、来期配当予想が減配の銘柄コードのset（文字列）を返す。
+
+    週次処理では3指数の全銘柄を渡す（決算短信の取得は EarningsStore で期限切れの銘柄だけ）。
+    コード未解決・APIエラー・予想未開示の銘柄は除外せずスキップする（fail-open）。
+    判定の材料集めと判定は get_dividend_cut_table を参照。
+
+    Args:
+        codes (list): 証券コードのリスト（int/str混在可）
+        fetcher (RateLimitedFetcher): 共有の取得器。省略時は create_edinet_fetcher()
+        use_cache (bool): EarningsStore を使うか
+        code_map_path (str): 証券コード→EDINETコードの対応表のキャッシュ
+
+    Returns:
+        set: 減配と判定された証券コードの集合（str）
+    """
+    df = get_dividend_cut_table(
+        codes, fetcher=fetcher, use_cache=use_cache, code_map_path=code_map_path
+    )
+    return set(df.index[df["is_cut"]])
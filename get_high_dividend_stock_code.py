@@ -1,18 +1,37 @@
 import logging
 import os
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from time import sleep
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+import requests
+from bs4 import BeautifulSoup
+from constituent_store import ConstituentStore
+from instrumentation import in_context, span, traced
 
 
+# 指数構成銘柄ページ。構成銘柄の表は静的HTMLに含まれるため、通常はブラウザを
+# 起動せず requests で取得して解析する（Selenium は表が取れなかった時の予備）。
+INDEX_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept-Language": "ja-JP,ja;q=0.9",
+}
+INDEX_PAGE_TIMEOUT = 20  # 1ページあたりのタイムアウト秒
+INDEX_URL = "https://indexes.nikkei.co.jp/nkave/index/component?idx={}"
+# 高配当株50 / 累進高配当株 / 連続増配株（この順番でセクター辞書をマージする）
+INDEX_IDS = ("nk225hdy", "nkphd", "nkcdg")
+COMPONENT_SELECTOR = "div.idx-index-components.table-responsive-md"
+
+
+@traced("selenium")
 def setup_driver(chromedriver_path="/usr/bin/chromedriver"):
     """Selenium WebDriverをセットアップして返す"""
+    # Selenium は表が取れなかった時の予備なので、使う時だけ読み込む
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service as ChromeService
+
     options = Options()
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
@@ -52,36 +71,39 @@ def setup_driver(chromedriver_path="/usr/bin/chromedriver"):
     return driver
 
 
-def extract_stock_codes(driver, url):
+def extract_stock_codes(driver, url, timeout=10):
     """
     指定されたURLから証券コードとセクター情報を取得する。
 
     Args:
         driver: Selenium WebDriverオブジェクト
         url: データを取得する対象のURL
+        timeout: ページ読み込みと表の出現を待つ最大秒
 
     Returns:
         codes: 証券コードのリスト
         sector_dict: 証券コードをキー、セクター名を値とする辞書
     """
-    driver.get(url)
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver.set_page_load_timeout(timeout)
+    with span("selenium", "index_page") as page_span:
+        driver.get(url)
 
-    # ページの読み込みを待機
-    WebDriverWait(driver, 10).until(
-        EC.presence_of_element_located(
-            (By.CSS_SELECTOR, "div.idx-index-components.table-responsive-md")
+        # ページの読み込みを待機
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, COMPONENT_SELECTOR))
         )
-    )
+        page_span.add(requests=1, nbytes=len(driver.page_source.encode("utf-8")))
 
     codes = []
     sector_dict = {}
 
     try:
         # テーブルデータを取得
-        sector_rows = driver.find_elements(
-            By.CSS_SELECTOR,
-            "div.idx-index-components.table-responsive-md",
-        )
+        sector_rows = driver.find_elements(By.CSS_SELECTOR, COMPONENT_SELECTOR)
         for row in sector_rows:
             sector = row.find_element(By.CSS_SELECTOR, "h3.idx-section-subheading")
             tickers = row.find_elements(By.TAG_NAME, "tr")
@@ -98,69 +120,238 @@ def extract_stock_codes(driver, url):
     return codes, sector_dict
 
 
-def get_high_dividend_stock_codes():
+def parse_stock_codes(html):
+    """
+    指数構成銘柄ページのHTMLから証券コードとセクター情報を取り出す。
+
+    extract_stock_codes（Selenium版）と同じ表を同じ手順で読む。
+
+    Returns:
+        codes: 証券コードのリスト（表が無ければ空）
+        sector_dict: 証券コードをキー、セクター名を値とする辞書
+    """
+    codes = []
+    sector_dict = {}
+
+    soup = BeautifulSoup(html, "html.parser")
+    for row in soup.select(COMPONENT_SELECTOR):
+        sector = row.select_one("h3.idx-section-subheading")
+        if sector is None:
+            continue
+        # Selenium の .text と同様に連続する空白を1つに畳む
+        sector_name = " ".join(sector.get_text().split())
+        for ticker in row.find_all("tr"):
+            cells = ticker.find_all("td")
+            if cells:
+                code = cells[0].get_text().strip()
+                if code.isdigit():
+                    codes.append(code)
+                    sector_dict[code] = sector_name
+
+    return codes, sector_dict
+
+
+def fetch_stock_codes(url, session=None, timeout=INDEX_PAGE_TIMEOUT):
+    """
+    指定されたURLを requests で取得し、証券コードとセクター情報を返す（ブラウザ不要）。
+
+    Returns:
+        codes: 証券コードのリスト（取得失敗・表が無い場合は空）
+        sector_dict: 証券コードをキー、セクター名を値とする辞書
+    """
+    getter = session if session is not None else requests
+    try:
+        with span("http", "index_page") as http_span:
+            r = getter.get(url, headers=INDEX_HEADERS, timeout=timeout)
+            http_span.add(requests=1, nbytes=len(r.content))
+        r.raise_for_status()
+    except requests.RequestException as e:
+        logging.error(f"Error fetching index page {url}: {e}")
+        return [], {}
+    return parse_stock_codes(r.text)
+
+
+def _quit_driver(driver):
+    """WebDriver を終了し、一時ディレクトリをクリーンアップする。"""
+    try:
+        driver.quit()
+    except Exception as e:
+        logging.error(f"Error closing driver: {e}")
+
+    # 一時ディレクトリをクリーンアップ
+    try:
+        temp_dir = driver.service.path
+        if temp_dir and os.path.exists(temp_dir):
+            import shutil
+
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    except Exception as e:
+        logging.error(f"Error cleaning up temp directory: {e}")
+
+
+class _DriverPool:
+    """
+    必要になった時だけ WebDriver を起動し、空いているものを使い回す小さなプール。
+
+    同時に読むページ数だけ起動するので、並列時は最大でページ数ぶん、
+    直列時は1つだけになる。
+    """
+
+    def __init__(self):
+        self._idle = []
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        driver = setup_driver()
+        with self._lock:
+            self._drivers.append(driver)
+        return driver
+
+    def release(self, driver):
+        with self._lock:
+            self._idle.append(driver)
+
+    def close(self):
+        for driver in self._drivers:
+            _quit_driver(driver)
+        self._drivers = []
+        self._idle = []
+
+
+def get_high_dividend_stock_codes(
+    selenium_fallback=False,
+    use_cache=True,
+    force_refresh=False,
+    parallel=True,
+    page_timeout=INDEX_PAGE_TIMEOUT,
+):
     """
     高配当株、累進配当株、連続増配株の証券コードとセクター情報を取得する。
 
+    構成銘柄は入れ替え時にしか変わらないため、ConstituentStore に保存した
+    リストが新しいうち（最終確認から REVALIDATE_DAYS 以内）は取得を省く。
+    取り直して入れ替えがあった場合は追加・除外銘柄を表示する。
+
+    各ページはまず requests で取得して静的HTMLの表を読む。表が取れなかった場合のみ、
+    selenium_fallback=True なら headless Chrome を起動して読み直す
+    （ブラウザは必要になった時点で起動する）。
+
+    parallel=True なら取り直しが必要なページを同時に読む（Selenium で読み直す場合は
+    ページごとに別の WebDriver を使う）。各ページには page_timeout 秒のタイムアウトが
+    個別にかかり、所要時間は3ページの合計ではなく最も遅いページ程度になる。
+    セクター辞書は並列でも直列と同じ順番（高配当→累進→連続増配）でマージする。
+
+    Args:
+        selenium_fallback (bool): 静的HTMLで表が取れない時に Selenium で読み直すか
+        use_cache (bool): 構成銘柄ストアを使うか
+        force_refresh (bool): ストアが新しくても取り直すか
+        parallel (bool): 3ページを同時に読むか
+        page_timeout (float): 1ページあたりのタイムアウト秒
+
     Returns:
         tuple: 以下の4つの要素を含むタプル
             - high_dividend_codes (list): 高配当株の証券コードリスト
             - progressive_codes (list): 累進配当株の証券コードリスト
             - consecutive_codes (list): 連続増配株の証券コードリスト
             - sector_dict (dict): 証券コードをキー、セクター名を値とする辞書
+            3指数とも構成銘柄が取れなかった場合は RuntimeError を投げる。
     """
-    driver = None
-    try:
-        driver = setup_driver()
+    store = ConstituentStore() if use_cache else None
+    pool = _DriverPool()
 
-        # 高配当株のデータを取得
-        high_dividend_url = (
-            "https://indexes.nikkei.co.jp/nkave/index/component?idx=nk225hdy"
-        )
-        high_dividend_codes, sector_dict = extract_stock_codes(
-            driver, high_dividend_url
-        )
-        # 累進配当株のデータを取得
-        progressive_url = "https://indexes.nikkei.co.jp/nkave/index/component?idx=nkphd"
-        progressive_codes, progressive_sector_dict = extract_stock_codes(
-            driver, progressive_url
-        )
+    def scrape_page(url):
+        codes, sectors = fetch_stock_codes(url, timeout=page_timeout)
+        if codes:
+            return codes, sectors
+        if not selenium_fallback:
+            logging.error(f"No stock codes in static HTML: {url}")
+            return codes, sectors
+        driver = None
+        try:
+            # 起動に失敗してもこのページだけを空にして、他のページは読み続ける
+            driver = pool.acquire()
+            return extract_stock_codes(driver, url, timeout=page_timeout)
+        except Exception as e:
+            logging.error(f"Error loading index page {url}: {e}")
+            return [], {}
+        finally:
+            if driver is not None:
+                pool.release(driver)
 
-        # sector_dictとprogressive_sector_dictをマージ
-        sector_dict.update(progressive_sector_dict)
+    # ストアが新しい指数はそのまま使い、残りだけを取り直す
+    results = {}
+    pending = []
+    for index_id in INDEX_IDS:
+        cached = None
+        if store is not None and not force_refresh:
+            cached = store.get_fresh(index_id)
+        if cached is not None:
+            results[index_id] = cached
+        else:
+            pending.append(index_id)
 
-        # 連続増配株のデータを取得
-        consecutive_url = "https://indexes.nikkei.co.jp/nkave/index/component?idx=nkcdg"
-        consecutive_codes, consecutive_sector_dict = extract_stock_codes(
-            driver, consecutive_url
-        )
+    try:
+        if pending:
+            workers = len(pending) if parallel else 1
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # 各ページのスパンを index_codes ステージの下に積む
+                scraped = executor.map(
+                    in_context(lambda i: scrape_page(INDEX_URL.format(i))), pending
+                )
+                results.update(zip(pending, scraped))
+    finally:
+        pool.close()
 
-        # sector_dictとconsecutive_sector_dictをマージ
-        sector_dict.update(consecutive_sector_dict)
+    # ストアへの保存は取得後にまとめて行う（取得に失敗した空のリストは保存しない）
+    for index_id in pending:
+        codes, sectors = results[index_id]
+        if store is not None and codes:
+            diff = store.update(index_id, codes, sectors)
+            if diff is not None:
+                print(
+                    f"{index_id} の構成銘柄が入れ替わりました（v{diff['version']}）: "
+                    f"追加 {diff['added']} / 除外 {diff['removed']}"
+                )
 
-        return high_dividend_codes, progressive_codes, consecutive_codes, sector_dict
+    # 構成銘柄が1つも取れなければ、後段で空の銘柄表を扱う前にここで止める
+    empty = [index_id for index_id in INDEX_IDS if not results[index_id][0]]
+    if len(empty) == len(INDEX_IDS):
+        hint = "" if selenium_fallback else "（Selenium での読み直しは無効）"
+        raise RuntimeError(
+            f"指数構成銘柄を1つも取得できませんでした: {', '.join(empty)}{hint}"
+        )
 
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception as e:
-                logging.error(f"Error closing driver: {e}")
+    # 高配当株のデータ
+    high_dividend_codes, sector_dict = results["nk225hdy"]
+    sector_dict = dict(sector_dict)
 
-            # 一時ディレクトリをクリーンアップ
-            try:
-                temp_dir = driver.service.path
-                if temp_dir and os.path.exists(temp_dir):
-                    import shutil
+    # 累進配当株のデータを取得し、sector_dictとprogressive_sector_dictをマージ
+    progressive_codes, progressive_sector_dict = results["nkphd"]
+    sector_dict.update(progressive_sector_dict)
 
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception as e:
-                logging.error(f"Error cleaning up temp directory: {e}")
+    # 連続増配株のデータを取得し、sector_dictとconsecutive_sector_dictをマージ
+    consecutive_codes, consecutive_sector_dict = results["nkcdg"]
+    sector_dict.update(consecutive_sector_dict)
+
+    return high_dividend_codes, progressive_codes, consecutive_codes, sector_dict
 
 
 # このスクリプトが直接実行された場合のみ動作
 if __name__ == "__main__":
-    high_dividend, progressive, consecutive, sectors = get_high_dividend_stock_codes()
+    import sys
+
+    # --selenium: 静的HTMLで表が取れない時に headless Chrome で読み直す
+    # --refresh: 構成銘柄ストアが新しくても取り直す
+    # --serial: 3ページを1つずつ読む
+    high_dividend, progressive, consecutive, sectors = get_high_dividend_stock_codes(
+        selenium_fallback="--selenium" in sys.argv,
+        force_refresh="--refresh" in sys.argv,
+        parallel="--serial" not in sys.argv,
+    )
     print("高配当株:", high_dividend)
     print("累進配当株:", progressive)
     print("連続増配株:", consecutive)
@@ -6,33 +6,39 @@ from watch_dividend import calculate_dividend_yield
 def get_holding_sector_dict(df_holding, codes):
     """
     保有銘柄の証券コードに対応するセクターを辞書に格納する。
+
+    購入履歴で証券コードごとに最初に現れた行のセクターを使う。
     """
-    holding_sector_dict = {}
-    for _code in codes:
-        _sector = df_holding[df_holding["証券コード"] == _code]["セクター"].values[0]
-        holding_sector_dict[_code] = _sector
-    return holding_sector_dict
+    first_sectors = df_holding.drop_duplicates(subset=["証券コード"], keep="first")
+    sector_by_code = dict(zip(first_sectors["証券コード"], first_sectors["セクター"]))
+    return {_code: sector_by_code[_code] for _code in codes}
 
 
-def calculate_latest_holdings(
-    df_holding, df_holding_number, codes, holding_sector_dict
-):
+def aggregate_holdings(df_quotes, df_holding_number):
     """
-    最新の株価データを取得し、保有銘柄の時価総額やセクター順序を計算する。
+    最新の株価表に合計株数・時価総額を付け、セクター順に並べ替える（取得は行わない）。
+
+    Args:
+        df_quotes (pd.DataFrame): calculate_dividend_yield の結果（URL列を除いたもの）
+        df_holding_number (pd.DataFrame): 証券コードごとの合計株数（証券コード・株数）
+
+    Returns:
+        tuple: (df_latest_holdings, sector_order)
+            - df_latest_holdings (pd.DataFrame): 時価総額の大きいセクター順、
+              セクター内は時価総額の降順に並べた保有銘柄表
+            - sector_order (list): セクターを合計時価総額の降順に並べたリスト
     """
-    # 最新の株価データを取得
-    df_latest_holdings = calculate_dividend_yield(
-        codes=codes, sector_dict=holding_sector_dict
-    )
-    df_latest_holdings.drop(columns=["URL"], inplace=True)
+    df_latest_holdings = df_quotes.copy()
 
-    # 各銘柄の合計株数を計算
-    df_latest_holdings["合計株数"] = 0
-    for _index, _stock in df_latest_holdings.iterrows():
-        _code = _stock["証券コード"]
-        _matching_row = df_holding_number[df_holding_number["証券コード"] == _code]
-        if not _matching_row.empty:
-            df_latest_holdings.at[_index, "合計株数"] = _matching_row["株数"].values[0]
+    # 各銘柄の合計株数（集計に無い銘柄は0株、端数が無ければ整数のまま）
+    number = df_holding_number.drop_duplicates(subset=["証券コード"], keep="first")
+    shares = df_latest_holdings["証券コード"].map(
+        number.set_index("証券コード")["株数"]
+    )
+    shares = shares.fillna(0)
+    if (shares % 1 == 0).all():
+        shares = shares.astype(int)
+    df_latest_holdings["合計株数"] = shares
 
     # 各銘柄の時価総額を計算
     df_latest_holdings["時価総額"] = (
@@ -50,8 +56,8 @@ def calculate_latest_holdings(
     sector_order = sector_total_market_cap.index.tolist()
 
     # セクターごとに並べ替え、セクター内は時価総額の降順に並べ替え
-    df_latest_holdings["セクター順序"] = df_latest_holdings["セクター"].apply(
-        lambda x: sector_order.index(x)
+    df_latest_holdings["セクター順序"] = df_latest_holdings["セクター"].map(
+        {sector: order for order, sector in enumerate(sector_order)}
     )
     df_latest_holdings = df_latest_holdings.sort_values(
         by=["セクター順序", "時価総額"], ascending=[True, False]
@@ -59,3 +65,20 @@ def calculate_latest_holdings(
     df_latest_holdings.drop(columns=["セクター順序"], inplace=True)
 
     return df_latest_holdings, sector_order
+
+
+def calculate_latest_holdings(
+    df_holding, df_holding_number, codes, holding_sector_dict, registry=None
+):
+    """
+    最新の株価データを取得し、保有銘柄の時価総額やセクター順序を計算する。
+
+    registry（QuoteRegistry）を渡すと、指数側の取得と会社ページを共有する。
+    """
+    # 最新の株価データを取得
+    df_latest_holdings = calculate_dividend_yield(
+        codes=codes, sector_dict=holding_sector_dict, registry=registry
+    )
+    df_latest_holdings.drop(columns=["URL"], inplace=True)
+
+    return aggregate_holdings(df_latest_holdings, df_holding_number)
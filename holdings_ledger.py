@@ -0,0 +1,249 @@
+"""購入履歴を毎週すべて集計し直さずに済ませる、証券コード別の保有台帳。
+
+「購入履歴」シートは追記しかされないので、証券コードごとの累計株数・取得額・
+セクター（最初の購入時と、購入に現れた全て）・初回/最終購入日を JSON に保存し、
+前回までに取り込んだ行数（ハイウォーターマーク）より後ろの行だけを足し込む。
+
+シートの読み込みも、見出し行と「前回最後に取り込んだ行」以降だけを1回で取得する。
+その行の内容ハッシュが保存値と一致しなければ（途中の行が書き換えられた・削除された）
+シート全体を読んで作り直す。取り込んだ全行の連鎖ハッシュ（プレフィックスハッシュ）も
+持っており、verify でシート全体からの再集計と突き合わせられる。
+"""
+
+import hashlib
+import json
+import math
+import os
+
+import pandas as pd
+
+LEDGER_PATH = "/home/taru-boy/Desktop/get_stock/cache/holdings_ledger.json"
+LAST_COLUMN = "Z"  # 購入履歴シートを読む右端の列
+LEDGER_VERSION = 2  # 保存形式を変えたら上げる（古い台帳はシートから作り直す）
+
+
+def _normalize(row):
+    """末尾の空セルを落とす（get_all_values と範囲指定の get で形を揃える）。"""
+    row = [str(cell) for cell in row]
+    while row and row[-1] == "":
+        row.pop()
+    return row
+
+
+def _row_hash(row):
+    payload = json.dumps(_normalize(row), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _chain_hash(prefix_hash, row_hash):
+    return hashlib.sha256((prefix_hash + row_hash).encode("utf-8")).hexdigest()
+
+
+def _number(value):
+    """pd.to_numeric(errors="coerce") と同じく数値化し、できなければ None。"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def _empty_data(header=None):
+    return {
+        "version": LEDGER_VERSION,
+        "header": header or [],
+        "rows": 0,
+        "last_row_hash": None,
+        "prefix_hash": "",
+        "positions": {},
+    }
+
+
+class HoldingsLedger:
+    """
+    購入履歴を証券コード別に累計した保有台帳（JSON に保存）。
+
+    Args:
+        path (str): 保存先の JSON ファイル（None なら保存しない）
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._data = self._load()
+
+    def _load(self):
+        if self.path is None:
+            return _empty_data()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != LEDGER_VERSION:
+                # 空の台帳にすると、次の sync で見出しが食い違いシート全体から作り直す
+                return _empty_data()
+            return data
+        except FileNotFoundError:
+            return _empty_data()
+        except (OSError, ValueError):
+            # 壊れていたら作り直す（シートから再集計できるデータなので）
+            return _empty_data()
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    @property
+    def rows(self):
+        """取り込み済みの行数（見出しを除く）。"""
+        return self._data["rows"]
+
+    @property
+    def empty(self):
+        return not self._data["positions"]
+
+    def apply(self, rows):
+        """
+        新しく追記された行（見出しを除く、シートの並び順）を台帳に足し込む。
+
+        証券コードが空の行も行数には数える（シートの行番号と揃えるため）。
+        """
+        header = self._data["header"]
+        column = {name: i for i, name in enumerate(header)}
+        positions = self._data["positions"]
+        for row in rows:
+            row_hash = _row_hash(row)
+            self._data["prefix_hash"] = _chain_hash(self._data["prefix_hash"], row_hash)
+            self._data["last_row_hash"] = row_hash
+            self._data["rows"] += 1
+
+            cells = _normalize(row) + [""] * len(header)
+            code = cells[column["証券コード"]].strip()
+            if not code:
+                continue
+            date = cells[column["日付"]]
+            price = _number(cells[column["取得単価"]])
+            shares = _number(cells[column["株数"]])
+
+            sector = cells[column["セクター"]]
+            position = positions.get(code)
+            if position is None:
+                position = positions[code] = {
+                    "セクター": sector,
+                    "セクター一覧": [],
+                    "株数": 0,
+                    "取得額": 0,
+                    "初回購入日": date,
+                    "最終購入日": date,
+                }
+            if sector not in position["セクター一覧"]:
+                position["セクター一覧"].append(sector)
+            if shares is not None:
+                position["株数"] += shares
+                if price is not None:
+                    position["取得額"] += price * shares
+            if date:
+                position["初回購入日"] = min(position["初回購入日"] or date, date)
+                position["最終購入日"] = max(position["最終購入日"] or date, date)
+
+    def rebuild(self, values):
+        """シート全体の値（get_all_values の戻り値、見出し込み）から作り直す。"""
+        header = _normalize(values[0]) if values else []
+        self._data = _empty_data(header)
+        self.apply(values[1:])
+
+    @classmethod
+    def from_values(cls, values):
+        """シート全体の値から再集計した、保存しない台帳を返す。"""
+        ledger = cls(path=None)
+        ledger.rebuild(values)
+        return ledger
+
+    def sync_ranges(self):
+        """sync が読む範囲（見出し行と、前回最後に取り込んだ行以降）の A1 表記。"""
+        rows = self._data["rows"]
+        # シートの1行目は見出しなので、取り込み済みの最後の行は rows + 1 行目
+        start = rows + 1 if rows else 2
+        return ["1:1", f"A{start}:{LAST_COLUMN}"]
+
+    def sync(self, worksheet):
+        """
+        購入履歴シートの追記分だけを取り込んで保存する。
+
+        見出し行と、前回最後に取り込んだ行以降を1回の batch_get で読む
+        （worksheet は gspread.Worksheet か SheetsGateway.worksheet の戻り値）。
+        見出しが変わった・前回最後の行が書き換えられた/消えた場合は全体を読み直す。
+
+        Returns:
+            int | None: 取り込んだ行数。全体を作り直した場合は None。
+        """
+        rows = self._data["rows"]
+        header, tail = worksheet.batch_get(self.sync_ranges())
+        header = _normalize(header[0]) if header else []
+
+        consistent = header == self._data["header"]
+        if consistent and rows:
+            consistent = bool(tail) and _row_hash(tail[0]) == self._data["last_row_hash"]
+            tail = tail[1:]
+        if not header or not consistent:
+            self.rebuild(worksheet.get_all_values())
+            self.save()
+            return None
+
+        self.apply(tail)
+        self.save()
+        return len(tail)
+
+    def verify(self, values):
+        """
+        シート全体の値から再集計した結果と突き合わせる。
+
+        Returns:
+            list: 食い違いの説明（一致していれば空）
+        """
+        expected = HoldingsLedger.from_values(values)._data
+        problems = []
+        for key in ("header", "rows", "prefix_hash"):
+            if self._data[key] != expected[key]:
+                problems.append(f"{key}: 台帳 {self._data[key]!r} / 再集計 {expected[key]!r}")
+        positions = self._data["positions"]
+        for code in sorted(set(positions) | set(expected["positions"])):
+            if positions.get(code) != expected["positions"].get(code):
+                problems.append(
+                    f"{code}: 台帳 {positions.get(code)} / 再集計 {expected['positions'].get(code)}"
+                )
+        return problems
+
+    def positions_frame(self):
+        """
+        証券コード別の保有表（最初に購入した順）。
+
+        Returns:
+            pd.DataFrame: 証券コード（数値化済み）・セクター（最初の購入時）・
+            セクター一覧（購入に現れた全て）・株数・取得額・初回購入日・最終購入日
+        """
+        columns = [
+            "証券コード",
+            "セクター",
+            "セクター一覧",
+            "株数",
+            "取得額",
+            "初回購入日",
+            "最終購入日",
+        ]
+        records = [
+            {"証券コード": code, **position}
+            for code, position in self._data["positions"].items()
+        ]
+        df = pd.DataFrame(records, columns=columns)
+        df["証券コード"] = pd.to_numeric(df["証券コード"], errors="coerce")
+        return df
@@ -0,0 +1,165 @@
+"""会社ページなどの HTTP レスポンスをローカルの SQLite に保存するキャッシュ。
+
+失敗した段からの再実行や watch_dividend.py の手動実行のたびに全ページを
+取り直さないよう、URL をキーに本文を zlib 圧縮して保存する。
+
+- 有効期限（TTL）は秒数か TTL_MARKET_CLOSE（次の大引けまで有効）で指定する。
+- 合計サイズが max_bytes を超えたら、最後に参照された時刻が古い順に捨てる（LRU）。
+- bypass=True（または環境変数 HTTP_CACHE_BYPASS=1）なら読まずに取り直す
+  （取り直した結果は保存するので、次回からは新しい内容が使われる）。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+CACHE_PATH = "/home/taru-boy/Desktop/get_stock/cache/http_cache.sqlite3"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024  # 圧縮後の合計サイズの上限
+TTL_MARKET_CLOSE = "market_close"
+
+# 東証の大引け（株価ページの内容が日中に変わりうるのは大引けまで）
+MARKET_TZ = ZoneInfo("Asia/Tokyo")
+MARKET_CLOSE = (15, 30)
+
+
+def next_market_close(now=None):
+    """
+    now の時点から見た次の大引け（平日15:30 JST）を epoch 秒で返す。
+
+    大引け後や週末に取得したページは、次の営業日の大引けまで有効とみなす。
+    祝日は考慮しない（祝日も平日扱いで、翌日の大引けで切れるだけなので実害は小さい）。
+    """
+    now = datetime.now(MARKET_TZ) if now is None else now.astimezone(MARKET_TZ)
+    close = now.replace(
+        hour=MARKET_CLOSE[0], minute=MARKET_CLOSE[1], second=0, microsecond=0
+    )
+    if now >= close:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:  # 土日は飛ばす
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+def bypass_from_env():
+    """環境変数 HTTP_CACHE_BYPASS が真ならキャッシュを読まない。"""
+    return os.getenv("HTTP_CACHE_BYPASS", "").lower() in ("1", "true", "yes")
+
+
+class HttpCache:
+    """
+    URL をキーにレスポンス本文を保存する SQLite キャッシュ（スレッドセーフ）。
+
+    Args:
+        path (str): SQLite ファイルのパス
+        ttl (float | str): 有効期限の秒数、または TTL_MARKET_CLOSE
+        max_bytes (int): 圧縮後の合計サイズの上限（超えたら LRU で削除）
+        bypass (bool): True なら読み出しを行わない。None なら環境変数に従う
+    """
+
+    def __init__(
+        self,
+        path=CACHE_PATH,
+        ttl=TTL_MARKET_CLOSE,
+        max_bytes=DEFAULT_MAX_BYTES,
+        bypass=None,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bypass = bypass_from_env() if bypass is None else bypass
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_last_access"
+            " ON responses (last_access)"
+        )
+        self._conn.commit()
+
+    def _expires_at(self, now):
+        if self.ttl == TTL_MARKET_CLOSE:
+            return next_market_close(datetime.fromtimestamp(now, MARKET_TZ))
+        return now + float(self.ttl)
+
+    def get(self, url):
+        """有効なキャッシュがあれば本文（str）を、無ければ None を返す。"""
+        if self.bypass:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, expires_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            body, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE url = ?", (now, url)
+            )
+            self._conn.commit()
+        return zlib.decompress(body).decode("utf-8")
+
+    def set(self, url, text):
+        """本文を圧縮して保存し、上限を超えていれば古いものから捨てる。"""
+        now = time.time()
+        body = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (url, body, size, fetched_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (url, body, len(body), now, self._expires_at(now), now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """期限切れを消し、合計サイズが上限以下になるまで LRU で削除する。"""
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT url, size FROM responses ORDER BY last_access ASC"
+        ).fetchall()
+        victims = []
+        for url, size in rows:
+            if total <= self.max_bytes:
+                break
+            victims.append((url,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE url = ?", victims)
+
+    def clear(self):
+        """全エントリを削除する。"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,269 @@
+"""週次処理のどこに時間がかかったかを残す、軽量な計測（スパン）。
+
+各ステージ・HTTP 取得・スプレッドシートの API 呼び出し・Selenium のページ読み込みを
+span（with 文）や traced（デコレータ）で囲むと、実行時間（wall）・CPU 時間・
+その時点のピーク RSS・リクエスト数・転送バイト数を記録する。
+子のスパンのリクエスト数・バイト数は親のスパン（ステージ）にも積み上がる。
+
+記録は run で囲んだ1回の実行ごとに1行の JSON として cron.log の隣の
+RUN_LOG_PATH に追記する（週ごとの比較・劣化の検知用）。
+
+- ステージのスパンは1つずつ（開始・終了時刻つき）
+- HTTP・シート・Selenium などのスパンは (種類, 名前) ごとに回数・合計・最大を集計
+- run の外ではスパンは何も記録しない（import しただけ・単体実行では無負荷）
+
+スレッドをまたぐ場合（スレッドプールに投げる関数）は in_context で包むと、
+投げた側のスパンを親として引き継ぐ。CPU 時間はスパンを実行したスレッドの分
+（thread_time）で、実行全体の cpu はプロセス全体（process_time）。
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+RUN_LOG_PATH = "/home/taru-boy/Desktop/get_stock/run_metrics.jsonl"
+STAGE_KIND = "stage"
+SLOWEST = 5  # 種類ごとに残す、時間のかかったスパンの数
+
+_run = None  # 計測中の Run（run の外では None）
+_current = contextvars.ContextVar("instrumentation_span", default=None)
+
+
+def peak_rss_kb():
+    """このプロセスのこれまでのピーク RSS（KB、Linux の ru_maxrss）。"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def payload_size(obj):
+    """JSON で送受信するデータのおおよそのバイト数。"""
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+class _NullSpan:
+    """run の外で使うスパン。何も記録しない。"""
+
+    active = False
+
+    def add(self, requests=0, nbytes=0):
+        pass
+
+    def add_payload(self, obj):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    計測中の1区間。add でリクエスト数・バイト数を足す。
+
+    Args:
+        kind (str): 種類（stage / http / sheets / selenium など）
+        name (str): 名前（ステージ名・ホスト名・API 名など）
+        parent (Span): 親のスパン（無ければ None）
+    """
+
+    active = True
+
+    def __init__(self, kind, name, parent=None):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.requests = 0
+        self.bytes = 0
+        self.error = None
+        self._start = time.perf_counter()
+        self._cpu_start = time.thread_time()
+
+    def add(self, requests=0, nbytes=0):
+        """このスパンと祖先のスパンにリクエスト数・バイト数を足す。"""
+        with _run.lock:
+            span = self
+            while span is not None:
+                span.requests += requests
+                span.bytes += nbytes
+                span = span.parent
+
+    def add_payload(self, obj):
+        """JSON で送受信したデータの大きさを1リクエスト分として足す。"""
+        self.add(requests=1, nbytes=payload_size(obj))
+
+    def finish(self):
+        end = time.perf_counter()
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "start": round(self._start - _run.origin, 3),
+            "wall": round(end - self._start, 3),
+            "cpu": round(time.thread_time() - self._cpu_start, 3),
+            "peak_rss_kb": peak_rss_kb(),
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "error": self.error,
+        }
+
+
+class Run:
+    """
+    1回の実行の計測結果を貯め、finish で1行の JSON にして追記する。
+
+    Args:
+        name (str): 実行の名前（スクリプト名など）
+        path (str): 追記先の JSON Lines ファイル
+    """
+
+    def __init__(self, name, path=RUN_LOG_PATH):
+        self.name = name
+        self.path = path
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.origin = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self.stages = []
+        self.totals = {}  # (種類, 名前) → 集計
+        self.slowest = {}  # 種類 → 時間のかかったスパン
+        self.result = None  # finish で書いた記録
+
+    def record(self, record):
+        with self.lock:
+            if record["kind"] == STAGE_KIND:
+                self.stages.append(record)
+                return
+            key = (record["kind"], record["name"])
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = {
+                    "kind": record["kind"],
+                    "name": record["name"],
+                    "count": 0,
+                    "errors": 0,
+                    "wall": 0.0,
+                    "max_wall": 0.0,
+                    "cpu": 0.0,
+                    "requests": 0,
+                    "bytes": 0,
+                }
+            total["count"] += 1
+            total["errors"] += record["error"] is not None
+            total["wall"] = round(total["wall"] + record["wall"], 3)
+            total["max_wall"] = max(total["max_wall"], record["wall"])
+            total["cpu"] = round(total["cpu"] + record["cpu"], 3)
+            total["requests"] += record["requests"]
+            total["bytes"] += record["bytes"]
+            slowest = self.slowest.setdefault(record["kind"], [])
+            slowest.append(record)
+            slowest.sort(key=lambda r: r["wall"], reverse=True)
+            del slowest[SLOWEST:]
+
+    def summary(self, status):
+        totals = list(self.totals.values())
+        return {
+            "run": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "argv": sys.argv[1:],
+            "status": status,
+            "wall": round(time.perf_counter() - self.origin, 3),
+            "cpu": round(time.process_time() - self._cpu_start, 3),
+            "peak_rss_kb": peak_rss_kb(),
+            "requests": sum(total["requests"] for total in totals),
+            "bytes": sum(total["bytes"] for total in totals),
+            "stages": sorted(self.stages, key=lambda r: r["start"]),
+            "totals": sorted(totals, key=lambda t: t["wall"], reverse=True),
+            "slowest": self.slowest,
+        }
+
+    def finish(self, status="ok"):
+        """結果を1行の JSON として追記する（書けなくても処理は止めない）。"""
+        summary = self.result = self.summary(status)
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not write run metrics: {e}")
+        return summary
+
+
+@contextmanager
+def run(name, path=RUN_LOG_PATH):
+    """
+    with の間を1回の実行として計測し、抜ける時に記録を追記する。
+
+    例外で抜けた場合は status に例外名を残して、例外はそのまま送出する。
+    """
+    global _run
+    _run = Run(name, path)
+    status = "ok"
+    try:
+        yield _run
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        current, _run = _run, None
+        current.finish(status)
+
+
+@contextmanager
+def span(kind, name):
+    """
+    with の間を1つのスパンとして計測する。Span（run の外では何もしないスパン）を返す。
+
+    Args:
+        kind (str): 種類（stage / http / sheets / selenium など）
+        name (str): 名前
+    """
+    if _run is None:
+        yield _NULL_SPAN
+        return
+    current = Span(kind, name, parent=_current.get())
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        if _run is not None:
+            _run.record(current.finish())
+
+
+def traced(kind, name=None):
+    """関数呼び出しをスパンで囲むデコレータ（name の既定は関数名）。"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, name or func.__name__):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def in_context(func):
+    """
+    スレッドプールに投げる関数を、今のスパンを親として動くように包む。
+
+    呼び出しごとに今のコンテキストの写しの中で func を実行する。
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
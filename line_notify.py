@@ -3,6 +3,8 @@ import json
 import urllib.request
 import urllib.error
 
+from instrumentation import span
+
 LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
 LIMIT = 4900  # LINEは1吹き出し最大5000字。安全側で4900に制限
 
@@ -58,8 +60,10 @@ def send_line(text):
             LINE_PUSH_URL, data=data, headers=headers, method="POST"
         )
         try:
-            with urllib.request.urlopen(req, timeout=30) as resp:
-                resp.read()
+            with span("http", "line") as http_span:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    response_body = resp.read()
+                http_span.add(requests=1, nbytes=len(data) + len(response_body))
         except urllib.error.HTTPError as e:
             detail = e.read().decode("utf-8", "ignore")
             print(f"LINE送信失敗 HTTPError {e.code}: {detail}")
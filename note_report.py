@@ -8,8 +8,12 @@ cron では run_pick_high_yield_stock.sh の末尾から本体実行の後に呼
 ただしスプレッドシートを読むだけなので、いつでも単体で再生成できる（疎結合）。
 
 既存方針に倣い fail-open（データ不足時は例外を投げず警告して終了）。
+
+--mirror を付けるとローカルの SQLite ミラー（sheet_mirror）を読む（シートが更新されて
+いれば先に取り直す）。--offline なら API を呼ばずにミラーだけで生成する。
 """
 
+import argparse
 import os
 import re
 from datetime import datetime
@@ -20,6 +24,9 @@ import pandas as pd
 from dotenv import load_dotenv
 from google.oauth2.service_account import Credentials
 
+from sheet_mirror import SheetMirror
+from sheets_gateway import SheetsGateway
+
 matplotlib.use("Agg")  # 画面の無いcron環境でも動かす
 import matplotlib.pyplot as plt  # noqa: E402
 import matplotlib.ticker as mticker  # noqa: E402
@@ -55,14 +62,13 @@ REPORT_FILENAME = "週次運用レポート.md"
 #   壊れた/プレースホルダのリンクを公開しないため）。
 FLAGSHIP_ARTICLE_URL = "https://note.com/tarutaru_bouzu/n/n22a7f1da8e1c"
 
-# 環境変数を読み込む（pick_high_yield_stock.py と同じ認証パターンを流用）
-load_dotenv(dotenv_path="/home/taru-boy/Desktop/get_stock/.env")
-SPREADSHEET_KEY = os.getenv("SPREADSHEET_KEY")
-SERVICE_ACCOUNT_JSON = os.getenv("SERVICE_ACCOUNT_JSON")
+# 認証情報の .env（pick_high_yield_stock.py と同じ認証パターンを流用、main で読む）
+ENV_PATH = "/home/taru-boy/Desktop/get_stock/.env"
 SCOPE = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
+REPORT_TABS = ("購入履歴", "時価総額", "配当推移")
 
 
 def _to_number(value):
@@ -82,14 +88,15 @@ def _to_number(value):
         return None
 
 
-def _read_worksheet(gc, title):
-    """指定タブを DataFrame で返す。タブが無ければ None。"""
-    try:
-        worksheet = gc.open_by_key(SPREADSHEET_KEY).worksheet(title)
-    except gspread.exceptions.WorksheetNotFound:
+def _read_worksheet(source, title):
+    """指定タブを DataFrame で返す。タブが無ければ None。
+
+    source は先読み済みの SheetsGateway か、ローカルの SheetMirror。
+    """
+    values = source.get_all_values(title)
+    if values is None:
         print(f"[warn] タブが見つかりません: {title}")
         return None
-    values = worksheet.get_all_values()
     if not values or len(values) < 2:
         print(f"[warn] タブにデータがありません: {title}")
         return pd.DataFrame(columns=values[0] if values else [])
@@ -152,7 +159,7 @@ def _cumulative_cost_series(df_holding, dates):
     return [h.loc[h["日付"] <= d, "_cost"].sum() for d in dates]
 
 
-def build_trend_graphs(df_trend, df_holding=None):
+def build_trend_graphs(df_trend, df_holding=None, output_dir=OUTPUT_DIR):
     """配当推移タブからトレンドグラフのPNGを生成し、(表示名, ファイル名) のリストを返す。
 
     日本語フォントが見つかればラベルも日本語にする。見つからない環境では
@@ -228,7 +235,7 @@ def build_trend_graphs(df_trend, df_holding=None):
         fig.autofmt_xdate()
         fig.tight_layout()
         filename = f"{slug}.png"  # 固定名で毎週上書き
-        fig.savefig(os.path.join(OUTPUT_DIR, filename), dpi=120)
+        fig.savefig(os.path.join(output_dir, filename), dpi=120)
         plt.close(fig)
         filenames.append((title, filename))
     return filenames
@@ -253,7 +260,7 @@ def _collapse_by_share(series, min_share=0.02):
     return keep
 
 
-def build_composition_graphs(df_market):
+def build_composition_graphs(df_market, output_dir=OUTPUT_DIR):
     """時価総額タブからポートフォリオ構成の円グラフ（PNG）を生成する。
 
     セクター別・銘柄別の2枚。19行/32行の表の代わりに「分散している」ことを
@@ -302,7 +309,7 @@ def build_composition_graphs(df_market):
         ax.axis("equal")
         fig.tight_layout()
         filename = f"{slug}.png"  # 固定名で毎週上書き
-        fig.savefig(os.path.join(OUTPUT_DIR, filename), dpi=120)
+        fig.savefig(os.path.join(output_dir, filename), dpi=120)
         plt.close(fig)
         return title, filename
 
@@ -485,41 +492,90 @@ def build_markdown(df_holding, df_market, df_trend, graph_files, pie_files, date
     return "\n".join(lines)
 
 
-def main():
-    if not SPREADSHEET_KEY or not SERVICE_ACCOUNT_JSON:
+def _open_source(use_mirror, offline):
+    """
+    タブを読む相手を返す（get_all_values を持つ SheetsGateway か SheetMirror）。
+
+    use_mirror なら、スプレッドシートの最終更新日時が変わっている時だけミラーを
+    取り直してからミラーを読む。offline なら API を一切呼ばずにミラーを読む。
+    """
+    if offline:
+        return SheetMirror()
+    spreadsheet_key = os.getenv("SPREADSHEET_KEY")
+    service_account_json = os.getenv("SERVICE_ACCOUNT_JSON")
+    if not spreadsheet_key or not service_account_json:
         print("[error] SPREADSHEET_KEY / SERVICE_ACCOUNT_JSON が未設定です。")
-        return
+        return None
 
     credentials = Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_JSON, scopes=SCOPE
+        service_account_json, scopes=SCOPE
     )
     gc = gspread.authorize(credentials)
 
-    df_holding = _read_worksheet(gc, "購入履歴")
-    df_market = _read_worksheet(gc, "時価総額")
-    df_trend = _read_worksheet(gc, "配当推移")
+    if use_mirror:
+        mirror = SheetMirror()
+        gateway = SheetsGateway(gc, spreadsheet_key, mirror=mirror)
+        gateway.sync_mirror()
+        return mirror
+
+    # スプレッドシートを一度だけ開き、3タブを1回の values_batch_get で読む
+    gateway = SheetsGateway(gc, spreadsheet_key)
+    gateway.prefetch([(title, None) for title in REPORT_TABS])
+    return gateway
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--mirror",
+        action="store_true",
+        help="ローカルミラーを読む（シートが更新されていれば先に取り直す）",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="API を呼ばずにローカルミラーだけを読む",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=OUTPUT_DIR,
+        help="Markdown とグラフの書き出し先（既定は note 投稿用のディレクトリ）",
+    )
+    args = parser.parse_args(argv)
+    output_dir = args.output_dir
+
+    # 環境変数を読み込む（既に設定されている値は上書きしない）
+    load_dotenv(dotenv_path=ENV_PATH)
+
+    source = _open_source(args.mirror, args.offline)
+    if source is None:
+        return
+
+    df_holding = _read_worksheet(source, "購入履歴")
+    df_market = _read_worksheet(source, "時価総額")
+    df_trend = _read_worksheet(source, "配当推移")
 
     if df_market is None and df_holding is None and df_trend is None:
         print("[error] 読み込めるタブがありませんでした。")
         return
 
     date_str = datetime.today().strftime("%Y-%m-%d")
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
 
-    graph_files = build_trend_graphs(df_trend, df_holding)
-    pie_files = build_composition_graphs(df_market)
+    graph_files = build_trend_graphs(df_trend, df_holding, output_dir)
+    pie_files = build_composition_graphs(df_market, output_dir)
     markdown = build_markdown(
         df_holding, df_market, df_trend, graph_files, pie_files, date_str
     )
 
-    output_path = os.path.join(OUTPUT_DIR, REPORT_FILENAME)
+    output_path = os.path.join(output_dir, REPORT_FILENAME)
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(markdown)
 
     print(markdown)
     print(f"\n[ok] レポートを書き出しました: {output_path}")
     for _, filename in graph_files + pie_files:
-        print(f"[ok] グラフ: {os.path.join(OUTPUT_DIR, filename)}")
+        print(f"[ok] グラフ: {os.path.join(output_dir, filename)}")
 
 
 if __name__ == "__main__":
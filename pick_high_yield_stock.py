@@ -1,190 +1,553 @@
+"""高配当株の週次選定スクリプト。
+
+保有銘柄の時価総額を「時価総額」「配当推移」シートに反映し、指数構成銘柄から
+今週の銘柄を選んで「購入履歴」に追記し、LINE に通知する。
+
+処理はステージ（pipeline.Pipeline）に分かれており、import しただけでは何もしない。
+スプレッドシートのクライアント・取得器・Selenium・pandas などの重い依存は、
+それを使うステージが動く時に初めて読み込む・作る（RunContext）。
+
+使い方:
+  python pick_high_yield_stock.py                   # 全ステージを実行（cron）
+  python pick_high_yield_stock.py --stage holdings  # 保有の時価総額の再計算だけ
+  python pick_high_yield_stock.py --list-stages     # ステージと依存関係を表示
+  python pick_high_yield_stock.py --resume          # 同じ日の途中で落ちた実行の続きから
+
+各ステージの結果は実行日ごとのチェックポイント（checkpoint.CheckpointStore）に残り、
+--resume では保存済みのステージを読み込んで飛ばす。今日の銘柄選定と送れた通知は
+--resume が無くても読み込むので、同じ日に再実行しても別の銘柄を選んだり、
+通知を二度送ったりしない。
+"""
+
+import argparse
+import logging
 import math
 import os
+import threading
 import time
 from datetime import datetime
+from functools import partial
 
-import gspread
-import pandas as pd
-from dotenv import load_dotenv
-from google.oauth2.service_account import Credentials
+import instrumentation
+from checkpoint import CHECKPOINT_DIR, CheckpointStore
 
-# 高配当株のコードを取得する関数をインポート
-from get_high_dividend_stock_code import get_high_dividend_stock_codes
+# 依存関係のあるステージを並行に実行する実行器をインポート
+from pipeline import Pipeline
 
-# 保有銘柄の計算関数をインポート
-from holding_calculator import calculate_latest_holdings, get_holding_sector_dict
+ENV_PATH = "/home/taru-boy/Desktop/get_stock/.env"
+ERROR_LOG = "error.log"
 
-# 銘柄選定関数をインポート
-from stock_selector import candidate_codes, select_stocks
+# Google Sheets APIとGoogle Drive APIのスコープ
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
 
-# 減配フィルタ（EDINET DB）をインポート
-from edinet_dividend import get_dividend_cut_codes
 
-# LINE通知関数をインポート
-from line_notify import send_line
+class RunContext:
+    """
+    1回の実行で共有するクライアント類。どれも最初に必要になった時に作る。
+
+    保有側と指数側のステージが並行に動くので、作成はロックで1回に限る。
+
+    Args:
+        no_cache (bool): 会社ページのローカルキャッシュを読まずに取り直すか
+        verify_ledger (bool): 保有台帳をシート全体の再集計と突き合わせるか
+        selenium_fallback (bool): 指数ページの表が取れない時に Selenium で読み直すか
+        checkpoint (CheckpointStore): ステージの結果の保存先（None なら保存しない）
+        state_dir (str): 指定するとキャッシュ・台帳・ミラー・スナップショットを
+            いつもの場所ではなくこのディレクトリに置き、会社ページ・指数ページ・
+            決算短信のキャッシュも使わない（replay.py の記録・再生用）
+    """
 
-# 最新の配当データフレームを作成する関数をインポート
-from watch_dividend import calculate_dividend_yield, create_latest_dividend_dataframe
+    def __init__(
+        self,
+        no_cache=False,
+        verify_ledger=False,
+        selenium_fallback=True,
+        checkpoint=None,
+        state_dir=None,
+    ):
+        self.no_cache = no_cache
+        self.verify_ledger = verify_ledger
+        self.selenium_fallback = selenium_fallback
+        self.checkpoint = checkpoint
+        self.state_dir = state_dir
+        self._clients = {}
+        self._lock = threading.RLock()
+
+    @property
+    def use_cache(self):
+        """取得結果のローカルキャッシュを使うか（state_dir 指定時は使わない）。"""
+        return self.state_dir is None
+
+    def state_path(self, name, default):
+        """state_dir 指定時はその中の name、それ以外は default。"""
+        if self.state_dir is None:
+            return default
+        return os.path.join(self.state_dir, name)
+
+    def _get(self, name, factory):
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = factory()
+            return self._clients[name]
+
+    def _load_env(self):
+        from dotenv import load_dotenv
+
+        # 環境変数を読み込む
+        load_dotenv(dotenv_path=ENV_PATH)
+        return True
+
+    def load_env(self):
+        """.env を（まだなら）読み込む。EDINET の API キーや LINE の認証情報もここから。"""
+        self._get("env", self._load_env)
+
+    @property
+    def spreadsheet_key(self):
+        self.load_env()
+        # スプレッドシートのキーを環境変数から取得
+        return os.getenv("SPREADSHEET_KEY")
+
+    def _authorize(self):
+        import gspread
+        from google.oauth2.service_account import Credentials
+
+        self.load_env()
+        # サービスアカウントのJSONファイルパスを環境変数から取得し、認証情報を作成
+        json_file = os.getenv("SERVICE_ACCOUNT_JSON")
+        credentials = Credentials.from_service_account_file(json_file, scopes=SCOPE)
+        # gspreadを使用してGoogle Sheets APIに認証
+        return gspread.authorize(credentials)
+
+    @property
+    def gc(self):
+        return self._get("gc", self._authorize)
+
+    def _create_quote_registry(self):
+        from watch_dividend import QuoteRegistry, create_quote_fetcher
+
+        return QuoteRegistry(
+            create_quote_fetcher(
+                use_cache=self.use_cache, cache_bypass=True if self.no_cache else None
+            )
+        )
 
-start_time = time.time()
+    @property
+    def quote_registry(self):
+        """
+        保有銘柄と指数構成銘柄で会社ページを共有し、1コード1回の取得で済ませる。
+        会社ページはローカルキャッシュ（大引けまで有効）にも残り、同日の再実行では取り直さない。
+        保有側と指数側のステージが同時に使っても、取得器のレート制限は共有される。
+        """
+        return self._get("quote_registry", self._create_quote_registry)
 
-# 環境変数を読み込む
-load_dotenv(dotenv_path="/home/taru-boy/Desktop/get_stock/.env")
+    def _create_holdings_ledger(self):
+        from holdings_ledger import LEDGER_PATH, HoldingsLedger
 
-# スプレッドシートのキーを環境変数から取得
-spreadsheet_key = os.getenv("SPREADSHEET_KEY")
+        return HoldingsLedger(self.state_path("holdings_ledger.json", LEDGER_PATH))
 
-# Google Sheets APIとGoogle Drive APIのスコープを設定
-scope = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
+    @property
+    def holdings_ledger(self):
+        return self._get("holdings_ledger", self._create_holdings_ledger)
+
+
+def update_worksheet_with_holdings(gateway, df_latest_holdings):
+    """
+    並べ替えた保有銘柄データを「時価総額」シートに書き込む（gateway.flush で送信）。
+    """
+    gateway.replace(
+        "時価総額",
+        [df_latest_holdings.columns.to_list()] + df_latest_holdings.values.tolist(),
+    )
 
-# サービスアカウントのJSONファイルパスを環境変数から取得
-json_file = os.getenv("SERVICE_ACCOUNT_JSON")
 
-# サービスアカウントの認証情報を作成
-credentials = Credentials.from_service_account_file(json_file, scopes=scope)
+def stage_gateway(ctx):
+    """
+    スプレッドシートを一度だけ開く。読み込みは先読み・書き込みは最後にまとめて送る。
+    書き込みはローカルの SQLite ミラーにも反映する（ミラーの失敗で本体は止めない）。
+    """
+    from sheet_mirror import MIRROR_PATH, SheetMirror
+    from sheets_gateway import SheetsGateway
 
-# gspreadを使用してGoogle Sheets APIに認証
-gc = gspread.authorize(credentials)
+    mirror = SheetMirror(ctx.state_path("sheet_mirror.sqlite3", MIRROR_PATH))
+    gateway = SheetsGateway(ctx.gc, ctx.spreadsheet_key, mirror=mirror)
+    try:
+        if gateway.sync_mirror():
+            print("スプレッドシートが更新されていたため、ローカルミラーを取り直しました。")
+    except Exception as e:
+        print(f"[warn] ローカルミラーを同期できませんでした: {e}")
+    return gateway
 
 
-def update_worksheet_with_holdings(gc, spreadsheet_key, df_latest_holdings):
+def stage_ledger(ctx, gateway):
     """
-    並べ替えた保有銘柄データを「時価総額」シートに書き込む。
+    「購入履歴」シートの追記分だけを保有台帳に取り込み、証券コードごとの保有を返す
+    （最初に購入した順、株数は累計済み）。
     """
-    worksheet = gc.open_by_key(spreadsheet_key).worksheet("時価総額")
-    worksheet.clear()
-    worksheet.update(
-        values=[df_latest_holdings.columns.to_list()]
-        + df_latest_holdings.values.tolist(),
-        range_name="A1",
+    holdings_ledger = ctx.holdings_ledger
+    # 購入履歴の追記分と配当推移の行数（追記位置）を1回の API 呼び出しで読む
+    gateway.prefetch(
+        [("購入履歴", a1) for a1 in holdings_ledger.sync_ranges()] + [("配当推移", "A:A")]
     )
+    worksheet = gateway.worksheet("購入履歴")
+    holdings_ledger.sync(worksheet)
+    gateway.set_row_count("購入履歴", holdings_ledger.rows + 1)
+
+    # --verify-ledger: シート全体から再集計して台帳と突き合わせる
+    if ctx.verify_ledger:
+        values = worksheet.get_all_values()
+        problems = holdings_ledger.verify(values)
+        if problems:
+            print("[warn] 保有台帳がシートの再集計と一致しません。作り直します。")
+            for problem in problems:
+                print(f"  {problem}")
+            holdings_ledger.rebuild(values)
+            holdings_ledger.save()
+        else:
+            print(f"[ok] 保有台帳（{holdings_ledger.rows}行）がシートの再集計と一致しました。")
+
+    return holdings_ledger.positions_frame()
 
 
-# 「購入履歴」シートを開き、データを取得
-worksheet = gc.open_by_key(spreadsheet_key).worksheet("購入履歴")
-data = worksheet.get_all_values()
+def stage_holdings(ctx, ledger):
+    """保有銘柄の最新株価から時価総額を計算する。(df_latest_holdings, sector_order) を返す。"""
+    import pandas as pd
 
-# データをPandasデータフレームに変換
-df_holding = pd.DataFrame(data[1:], columns=data[0])
-df_latest_holdings = pd.DataFrame()
-sector_order = []
+    from holding_calculator import calculate_latest_holdings, get_holding_sector_dict
 
-if not df_holding.empty:
-    # データ型を適切に変換（数値型に変換可能な列を変換）
-    df_holding["証券コード"] = pd.to_numeric(df_holding["証券コード"], errors="coerce")
-    df_holding["取得単価"] = pd.to_numeric(df_holding["取得単価"], errors="coerce")
-    df_holding["株数"] = pd.to_numeric(df_holding["株数"], errors="coerce")
+    df_holding = ledger
+    if df_holding.empty:
+        return pd.DataFrame(), []
 
-    # 証券コードごとに保有株数を集計
-    df_holding_number = df_holding.groupby("証券コード", as_index=False)["株数"].sum()
+    # 証券コードごとの保有株数（台帳で集計済み）
+    df_holding_number = df_holding[["証券コード", "株数"]]
 
     # 保有銘柄のセクター辞書を作成
     codes = list(df_holding["証券コード"].unique())
     holding_sector_dict = get_holding_sector_dict(df_holding, codes)
 
     # 最新の保有銘柄データを計算
-    df_latest_holdings, sector_order = calculate_latest_holdings(
-        df_holding, df_holding_number, codes, holding_sector_dict
+    return calculate_latest_holdings(
+        df_holding, df_holding_number, codes, holding_sector_dict, ctx.quote_registry
     )
 
-    # 並べ替えたデータを「時価総額」シートに書き込む
-    update_worksheet_with_holdings(gc, spreadsheet_key, df_latest_holdings)
 
-    # 全保有銘柄の総年間配当を計算して「配当推移」シートに追記
-    total_annual_div = round(
-        (
-            df_latest_holdings["合計株数"]
-            * df_latest_holdings["株価"]
-            * df_latest_holdings["配当利回り(%)"]
-            / 100
-        ).sum()
+def stage_index_codes(ctx):
+    """指数構成銘柄を requests で取得し、表が取れない時だけ Selenium で読み直す。"""
+    from get_high_dividend_stock_code import get_high_dividend_stock_codes
+
+    return get_high_dividend_stock_codes(
+        selenium_fallback=ctx.selenium_fallback, use_cache=ctx.use_cache
     )
-    total_market_cap = int(df_latest_holdings["時価総額"].sum())
-    record_date = datetime.today().strftime("%Y-%m-%d")
-    try:
-        ws_trend = gc.open_by_key(spreadsheet_key).worksheet("配当推移")
-    except gspread.exceptions.WorksheetNotFound:
-        sp = gc.open_by_key(spreadsheet_key)
-        ws_trend = sp.add_worksheet(title="配当推移", rows=500, cols=3)
-        ws_trend.append_row(["日付", "総年間配当(円)", "総時価総額(円)"])
-    ws_trend.append_row([record_date, total_annual_div, total_market_cap])
 
 
-# 最新の配当データを取得し、データフレームを作成
-high_dividend_codes, progressive_codes, consecutive_codes, sector_dict = (
-    get_high_dividend_stock_codes()
-)
-df_stocks = create_latest_dividend_dataframe(
-    high_dividend_codes, progressive_codes, consecutive_codes, sector_dict
-)
+def stage_stocks(ctx, index_codes):
+    """最新の配当データを取得し、配当利回りの降順に並べた銘柄表を返す。"""
+    from watch_dividend import create_latest_dividend_dataframe
 
-# df_stocks = pd.read_csv("/home/taru-boy/Desktop/get_stock/high_dividend_stocks.csv")
-df_stocks.sort_values(by="配当利回り(%)", ascending=False, inplace=True)
+    high_dividend_codes, progressive_codes, consecutive_codes, sector_dict = index_codes
+    df_stocks = create_latest_dividend_dataframe(
+        high_dividend_codes,
+        progressive_codes,
+        consecutive_codes,
+        sector_dict,
+        registry=ctx.quote_registry,
+    )
 
-# 並べ替えたデータを「今週の銘柄」シートに書き込む
-worksheet = gc.open_by_key(spreadsheet_key).worksheet("今週の銘柄")
-worksheet.clear()
-worksheet.update(
-    values=[df_stocks.columns.to_list()] + df_stocks.fillna("").values.tolist(),
-    range_name="A1",
-)
+    # df_stocks = pd.read_csv("/home/taru-boy/Desktop/get_stock/high_dividend_stocks.csv")
+    df_stocks.sort_values(by="配当利回り(%)", ascending=False, inplace=True)
+    return df_stocks
 
-held_sector = df_holding["セクター"].unique()
-
-# 候補集合の来期減配予想銘柄を取得（候補集合のみ叩いてレート節約）
-cut_codes = get_dividend_cut_codes(candidate_codes(df_stocks))
-if cut_codes:
-    print(f"減配予想のため除外: {sorted(cut_codes)}")
-
-# 銘柄選定（2銘柄）
-picked_stocks = select_stocks(df_stocks, df_latest_holdings, held_sector, cut_codes, n=2)
-
-if picked_stocks:
-    today = datetime.today().strftime("%Y-%m-%d")
-    worksheet = gc.open_by_key(spreadsheet_key).worksheet("購入履歴")
-    circled = "①②③④⑤⑥⑦⑧⑨⑩"
-    message_lines = [f"今週の高配当銘柄 ({today})", ""]
-    for i, picked_stock in enumerate(picked_stocks):
-        picked_code = int(picked_stock["証券コード"])
-        picked_name = picked_stock["会社名"]
-        picked_sector = picked_stock["セクター"]
-        picked_price = picked_stock["株価"]
-        picked_yield = picked_stock["配当利回り(%)"]
-
-        # 購入履歴に追加（1万円以上になるよう株数を切り上げ）
-        amount = math.ceil(10000 / picked_price)
-        worksheet.append_row(
-            [
-                str(today),
-                picked_code,
-                str(picked_name),
-                str(picked_sector),
-                float(picked_price),
-                int(amount),
-            ]
-        )
 
-        # LINE通知用のメッセージを組み立てる
-        mark = circled[i] if i < len(circled) else f"{i + 1}."
-        message_lines.append(f"{mark}{picked_name} ({picked_code})")
-        message_lines.append(
-            f" {picked_sector} / 利回り{picked_yield}% / "
-            f"{picked_price:,.0f}円 / {amount}株"
+def stage_candidates(ctx, stocks):
+    """候補銘柄の索引を一度だけ作り、銘柄選定の各段階で共有する。"""
+    from stock_selector import CandidateIndex
+
+    return CandidateIndex(stocks)
+
+
+def stage_cut_codes(ctx, stocks):
+    """
+    3指数の全銘柄の来期減配予想を判定する（判定は screen_dividend_cuts でまとめて行い、
+    決算短信は EarningsStore の期限が切れた銘柄だけを取り直す）。
+    """
+    from edinet_dividend import CODE_MAP_PATH, get_dividend_cut_codes
+
+    ctx.load_env()
+
+    cut_codes = get_dividend_cut_codes(
+        list(dict.fromkeys(stocks["証券コード"])),
+        use_cache=ctx.use_cache,
+        code_map_path=ctx.state_path("edinet_code_map.json", CODE_MAP_PATH),
+    )
+    if cut_codes:
+        print(f"減配予想のため除外: {sorted(cut_codes)}")
+    return cut_codes
+
+
+def stage_snapshot(ctx, stocks, cut_codes):
+    """今週の銘柄表と減配除外をバックテスト用のスナップショットとして保存する。"""
+    from backtest import SNAPSHOT_DIR, save_snapshot
+
+    return save_snapshot(
+        stocks, cut_codes, directory=ctx.state_path("snapshots", SNAPSHOT_DIR)
+    )
+
+
+def stage_picks(ctx, ledger, holdings, candidates, cut_codes):
+    """銘柄選定（2銘柄）。"""
+    from stock_selector import PICKS_PER_WEEK, select_stocks
+
+    df_latest_holdings, _ = holdings
+    # 同じ銘柄でも購入ごとにセクターが違えば、その全てを保有セクターに数える
+    held_sector = ledger["セクター一覧"].explode().dropna().unique()
+    return select_stocks(
+        candidates, df_latest_holdings, held_sector, cut_codes, n=PICKS_PER_WEEK
+    )
+
+
+def stage_sheets(ctx, gateway, ledger, holdings, stocks, picks):
+    """
+    時価総額・配当推移・今週の銘柄・購入履歴への書き込みを積んでまとめて送る。
+    LINE 通知用のメッセージ行を返す（選定なしなら空）。
+
+    同じ日の再実行で追記が重ならないよう、配当推移に今日の行があれば追記せず、
+    購入履歴に今日の購入があれば購入履歴には追記しない（メッセージは組み立てる）。
+    """
+    from stock_selector import LOT_YEN
+
+    df_latest_holdings, _ = holdings
+    if not df_latest_holdings.empty:
+        # 並べ替えたデータを「時価総額」シートに書き込む
+        update_worksheet_with_holdings(gateway, df_latest_holdings)
+
+        # 全保有銘柄の総年間配当を計算して「配当推移」シートに追記
+        total_annual_div = round(
+            (
+                df_latest_holdings["合計株数"]
+                * df_latest_holdings["株価"]
+                * df_latest_holdings["配当利回り(%)"]
+                / 100
+            ).sum()
         )
-        message_lines.append("")
-    print(f"{len(picked_stocks)}銘柄を購入履歴に追記しました。")
+        total_market_cap = int(df_latest_holdings["時価総額"].sum())
+        record_date = datetime.today().strftime("%Y-%m-%d")
+        if not gateway.has_tab("配当推移"):
+            gateway.add_tab("配当推移", rows=500, cols=3)
+            gateway.append("配当推移", [["日付", "総年間配当(円)", "総時価総額(円)"]])
+        recorded = gateway.get("配当推移", "A:A") or []
+        if recorded and recorded[-1] and recorded[-1][0] == record_date:
+            print(f"配当推移には {record_date} の行があるので追記しません。")
+        else:
+            gateway.append(
+                "配当推移", [[record_date, total_annual_div, total_market_cap]]
+            )
+
+    # 並べ替えたデータを「今週の銘柄」シートに書き込む
+    gateway.replace(
+        "今週の銘柄",
+        [stocks.columns.to_list()] + stocks.fillna("").values.tolist(),
+    )
 
-    # 選定結果をLINEに通知（失敗してもスクリプトは止めない）
-    if send_line("\n".join(message_lines).strip()):
+    message_lines = []
+    purchased_today = False
+    if picks:
+        today = datetime.today().strftime("%Y-%m-%d")
+        circled = "①②③④⑤⑥⑦⑧⑨⑩"
+        message_lines = [f"今週の高配当銘柄 ({today})", ""]
+        purchase_rows = []
+        for i, picked_stock in enumerate(picks):
+            picked_code = int(picked_stock["証券コード"])
+            picked_name = picked_stock["会社名"]
+            picked_sector = picked_stock["セクター"]
+            picked_price = picked_stock["株価"]
+            picked_yield = picked_stock["配当利回り(%)"]
+
+            # 購入履歴に追加（1万円以上になるよう株数を切り上げ）
+            amount = math.ceil(LOT_YEN / picked_price)
+            purchase_rows.append(
+                [
+                    str(today),
+                    picked_code,
+                    str(picked_name),
+                    str(picked_sector),
+                    float(picked_price),
+                    int(amount),
+                ]
+            )
+
+            # LINE通知用のメッセージを組み立てる
+            mark = circled[i] if i < len(circled) else f"{i + 1}."
+            message_lines.append(f"{mark}{picked_name} ({picked_code})")
+            message_lines.append(
+                f" {picked_sector} / 利回り{picked_yield}% / "
+                f"{picked_price:,.0f}円 / {amount}株"
+            )
+            message_lines.append("")
+        purchased_today = not ledger.empty and (ledger["最終購入日"] == today).any()
+        if purchased_today:
+            print(f"購入履歴には {today} の購入があるので追記しません。")
+        else:
+            gateway.append("購入履歴", purchase_rows)
+
+    # ここまでに積んだシートへの書き込みをまとめて送る
+    gateway.flush()
+    if picks and not purchased_today:
+        print(f"{len(picks)}銘柄を購入履歴に追記しました。")
+    return message_lines
+
+
+def stage_notify(ctx, sheets):
+    """選定結果をLINEに通知する（失敗してもスクリプトは止めない）。"""
+    from line_notify import send_line
+
+    ctx.load_env()
+
+    if not sheets:
+        print("適切な銘柄が見つかりませんでした。")
+        return False
+    if send_line("\n".join(sheets).strip()):
         print("LINEに選定結果を通知しました。")
-    else:
-        print("LINE通知に失敗しました。")
-else:
-    print("適切な銘柄が見つかりませんでした。")
-
-end_time = time.time()
-execution_time = end_time - start_time
-print(f"スクリプトの実行時間: {execution_time:.2f}秒")
+        return True
+    print("LINE通知に失敗しました。")
+    return False
+
+
+STAGES = (
+    # (ステージ名, 関数, 依存先)
+    ("gateway", stage_gateway, ()),
+    ("ledger", stage_ledger, ("gateway",)),
+    ("holdings", stage_holdings, ("ledger",)),
+    ("index_codes", stage_index_codes, ()),
+    ("stocks", stage_stocks, ("index_codes",)),
+    ("candidates", stage_candidates, ("stocks",)),
+    ("cut_codes", stage_cut_codes, ("stocks",)),
+    ("snapshot", stage_snapshot, ("stocks", "cut_codes")),
+    ("picks", stage_picks, ("ledger", "holdings", "candidates", "cut_codes")),
+    ("sheets", stage_sheets, ("gateway", "ledger", "holdings", "stocks", "picks")),
+    ("notify", stage_notify, ("sheets",)),
+)
+# 結果をチェックポイントに残すステージ（gateway・ledger・candidates は作り直す方が安い）。
+# --stage の指定が無い時はこれらを実行の目標にするので、gateway・ledger・candidates は
+# 読み込めなかったステージの依存先になった時だけ動く（全て読み込めればシートも開かない）
+CHECKPOINT_STAGES = (
+    "index_codes",
+    "stocks",
+    "holdings",
+    "cut_codes",
+    "snapshot",
+    "picks",
+    "sheets",
+    "notify",
+)
+# --resume が無くても今日のチェックポイントを読むステージ（1日1回だけ決める・送るもの）
+DAILY_STAGES = ("picks", "notify")
+# 結果がこの条件を満たす時だけチェックポイントに残すステージ
+# （LINE 通知に失敗した False は残さず、次の実行で送り直す）
+CHECKPOINT_CONDITIONS = {"notify": bool}
+
+
+def build_pipeline(ctx):
+    """
+    週次処理のステージと依存関係。
+
+    保有側（シート→台帳→保有株価）と指数側（構成銘柄→株価→減配チェック・候補）は
+    互いに依存しないので並行に進み、銘柄選定で合流する。
+    """
+    pipeline = Pipeline()
+    for name, func, deps in STAGES:
+        func = partial(func, ctx)
+        if ctx.checkpoint is not None and name in CHECKPOINT_STAGES:
+            func = ctx.checkpoint.wrap(
+                name, func, save_if=CHECKPOINT_CONDITIONS.get(name)
+            )
+        pipeline.add(name, func, deps)
+    return pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="会社ページのローカルキャッシュを読まずに取り直す",
+    )
+    parser.add_argument(
+        "--verify-ledger",
+        action="store_true",
+        help="保有台帳を購入履歴シート全体の再集計と突き合わせる",
+    )
+    parser.add_argument(
+        "--no-selenium",
+        action="store_true",
+        help="指数ページの表が取れなくても Selenium で読み直さない",
+    )
+    parser.add_argument(
+        "--stage",
+        action="append",
+        dest="stages",
+        metavar="NAME",
+        help="このステージ（と依存先）だけを実行する（複数指定可）",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="今日のチェックポイントがあるステージは実行せずに読み込む",
+    )
+    parser.add_argument(
+        "--state-dir",
+        metavar="DIR",
+        help="キャッシュ・台帳・チェックポイント・計測をこのディレクトリに置く"
+        "（キャッシュは使わない。replay.py の記録・再生用）",
+    )
+    parser.add_argument(
+        "--list-stages", action="store_true", help="ステージと依存関係を表示する"
+    )
+    args = parser.parse_args(argv)
+
+    if args.list_stages:
+        for name, _, deps in STAGES:
+            print(f"{name:<12} <- {', '.join(deps) or '-'}")
+        return {}
+
+    logging.basicConfig(level=logging.ERROR, filename=ERROR_LOG)
+    start_time = time.time()
+
+    state_dir = args.state_dir
+    checkpoint = CheckpointStore(
+        root=os.path.join(state_dir, "checkpoints") if state_dir else CHECKPOINT_DIR
+    )
+    checkpoint.prune()
+    done = checkpoint.load(CHECKPOINT_STAGES if args.resume else DAILY_STAGES)
+    if done:
+        print(f"チェックポイント（{checkpoint.run_date}）から再開: {', '.join(done)}")
+
+    ctx = RunContext(
+        no_cache=args.no_cache,
+        verify_ledger=args.verify_ledger,
+        selenium_fallback=not args.no_selenium,
+        checkpoint=checkpoint,
+        state_dir=state_dir,
+    )
+    pipeline = build_pipeline(ctx)
+    # ステージ・HTTP・シート・Selenium の計測を cron.log の隣に1行で残す
+    metrics_path = ctx.state_path("run_metrics.jsonl", instrumentation.RUN_LOG_PATH)
+    with instrumentation.run("pick_high_yield_stock", metrics_path) as run:
+        results = pipeline.run(args.stages or CHECKPOINT_STAGES, done=done)
+    print(pipeline.report())
+    summary = run.result
+    print(
+        f"リクエスト: {summary['requests']}回 / {summary['bytes'] / 1024:.0f}KB、"
+        f"CPU: {summary['cpu']:.2f}秒、ピークRSS: {summary['peak_rss_kb'] / 1024:.0f}MB"
+    )
+
+    end_time = time.time()
+    execution_time = end_time - start_time
+    print(f"スクリプトの実行時間: {execution_time:.2f}秒")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""依存関係を宣言した処理段（ステージ）を、依存が満たされたものから並行に実行する小さな実行器。
+
+週次処理は「保有銘柄の株価取得」と「指数構成銘柄の取得→株価取得→減配チェック」のように
+互いに依存しない流れを含む。各ステージに依存先を宣言しておけば、依存先が全て終わった
+ステージから順にスレッドプールへ投入するので、全体の所要時間は各ステージの合計ではなく
+最も長い依存の連鎖（クリティカルパス）に近づく。
+
+ステージ関数は依存先ステージの戻り値をキーワード引数（ステージ名）で受け取る。
+run に done（チェックポイントから読んだ戻り値など）を渡すと、そのステージは実行せず、
+他に必要とするステージが無ければその依存先も実行しない。
+どこかのステージが例外を出したら新しいステージは投入せず、実行中のものを待ってから
+その例外をそのまま送出する（直列実行と同じく途中で止まる）。
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple, Tuple
+
+from instrumentation import STAGE_KIND, in_context, span
+
+DEFAULT_MAX_WORKERS = 4
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable
+    deps: Tuple[str, ...] = ()
+
+
+class StageTiming(NamedTuple):
+    name: str
+    start: float  # 実行開始からの秒
+    end: float
+
+
+class Pipeline:
+    """
+    ステージの依存グラフ（DAG）を組み立てて実行する。
+
+    Args:
+        max_workers (int): 同時に実行するステージ数の上限
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.timings = []
+
+    def add(self, name, func, deps=()):
+        """
+        ステージを登録する。依存先は先に登録しておく。
+
+        Args:
+            name (str): ステージ名（依存先の戻り値を渡す時の引数名にもなる）
+            func (callable): func(**{依存先の名前: 戻り値}) で呼ばれる関数
+            deps (iterable): 依存先のステージ名
+        """
+        deps = tuple(deps)
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Unknown dependency of {name}: {dep}")
+        self.stages[name] = Stage(name, func, deps)
+        return self
+
+    def required(self, targets=None, done=()):
+        """
+        targets（省略時は全ステージ）とその依存先の名前を登録順に返す。
+
+        done に含まれるステージは結果が分かっているので、その依存先はたどらない。
+        done に無い targets は必ず実行するので、他のステージの入力を作るだけの
+        ステージまで実行させたくない時は、結果が欲しいステージだけを targets に渡す。
+        """
+        needed = set()
+        stack = list(self.stages if targets is None else targets)
+        while stack:
+            name = stack.pop()
+            if name in needed:
+                continue
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            needed.add(name)
+            if name not in done:
+                stack.extend(self.stages[name].deps)
+        return [name for name in self.stages if name in needed]
+
+    def run(self, targets=None, done=None):
+        """
+        ステージを依存順に実行する（依存し合わないステージは並行に動く）。
+
+        Args:
+            targets (iterable): 実行したいステージ名（省略時は全ステージ）。
+                依存先も自動的に実行する。
+            done (dict): 実行済みとして扱うステージ名 → 戻り値
+
+        Returns:
+            dict: ステージ名 → 戻り値
+        """
+        done = done or {}
+        names = self.required(targets, done)
+        results = {name: done[name] for name in names if name in done}
+        self.timings = []
+        origin = time.perf_counter()
+        remaining = {
+            name: set(self.stages[name].deps) - set(results)
+            for name in names
+            if name not in results
+        }
+
+        def call(stage):
+            start = time.perf_counter() - origin
+            try:
+                with span(STAGE_KIND, stage.name):
+                    return stage.func(**{dep: results[dep] for dep in stage.deps})
+            finally:
+                self.timings.append(
+                    StageTiming(stage.name, start, time.perf_counter() - origin)
+                )
+
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while remaining or running:
+                if error is None:
+                    ready = [name for name, deps in remaining.items() if not deps]
+                    for name in ready:
+                        del remaining[name]
+                        future = executor.submit(in_context(call), self.stages[name])
+                        running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                        continue
+                    for deps in remaining.values():
+                        deps.discard(name)
+        if error is not None:
+            raise error
+        return results
+
+    def report(self):
+        """直近の run の各ステージの開始・終了時刻（秒）を表にした文字列。"""
+        lines = [f"{'ステージ':<20}{'開始':>8}{'終了':>8}{'所要':>8}"]
+        for timing in sorted(self.timings, key=lambda t: t.start):
+            lines.append(
+                f"{timing.name:<20}{timing.start:>8.2f}{timing.end:>8.2f}"
+                f"{timing.end - timing.start:>8.2f}"
+            )
+        return "\n".join(lines)
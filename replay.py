@@ -0,0 +1,415 @@
+"""外部呼び出しを記録し、ネットワークなしで週次処理を再生する（フィクスチャの記録・再生）。
+
+記録（record）では pick_high_yield_stock.py → note_report.py を本番と同じく実行し、
+その間の外部呼び出し（nikkei.com の会社ページ・指数ページ・EDINET DB・
+Google Sheets / Drive・LINE）の応答をフィクスチャのバンドル（ディレクトリ）に残す。
+再生（replay）では同じ処理を、記録した応答を返すだけでネットワークに出ずに実行する。
+認証情報の無い環境でも同じ結果になるので、プロファイリングや回帰ベンチマークに使う。
+
+- 差し込み口: requests.Session.request（requests.get・gspread・google-auth もここを通る）と
+  urllib.request.urlopen（LINE 通知）を差し替える
+- 照合: メソッドと URL（クエリ込み）が同じ呼び出しに、記録した順番で応答を返す
+  （本文は照合しないので、日付入りの書き込みも再生できる）。使い切ったら最後の応答を返す
+- 再生では認証を匿名にし、レート制限の待ちも省く。記録に無い呼び出しは
+  接続エラー（ReplayMiss / URLError）として扱う（各所の fail-open がそのまま働く）
+- 記録・再生ともローカルの状態（キャッシュ・台帳・ミラー・チェックポイント・
+  スナップショット・計測）はバンドル内の作業ディレクトリに作り直し、
+  キャッシュも使わない（同じ呼び出しの並びにするため）。Selenium は使わない
+- 認証のトークン取得は記録しない。環境変数は値を残さず「設定されていたか」だけを残す
+  （URL に入るスプレッドシートのキーだけは値を残す）
+- 記録は本番のシート・LINE につながるので、既定では書き込みを外に出さない。
+  GET / HEAD 以外の呼び出し（シートの flush と LINE の push）は送らずに
+  空の成功応答（200・{}）を返し、その応答を記録する（再生でも同じ並びになる）。
+  本番のシートを書き換え、LINE に通知してよいときだけ --allow-writes を付ける
+
+使い方:
+  python replay.py record fixtures/2026-10-16
+  python replay.py record fixtures/2026-10-16 --allow-writes
+  python replay.py replay fixtures/2026-10-16
+  python replay.py replay fixtures/2026-10-16 -- --stage holdings
+"""
+
+import argparse
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+MANIFEST = "manifest.json"
+EXCHANGES = "exchanges.jsonl.gz"
+# 記録しないホスト（認証のトークン取得。再生では匿名の認証を使うので呼ばれない）
+PASSTHROUGH_HOSTS = ("oauth2.googleapis.com", "accounts.google.com")
+# URL に入っていても記録しないクエリ
+REDACTED_PARAMS = ("key", "api_key", "access_token", "token")
+# 記録で外に出してよいメソッド（それ以外は --allow-writes が無ければ送らない）
+READ_METHODS = ("GET", "HEAD")
+# 送らなかった書き込みの代わりに返す応答
+BLOCKED_STATUS = 200
+BLOCKED_HEADERS = {"Content-Type": "application/json; charset=UTF-8"}
+BLOCKED_BODY = b"{}"
+# 応答のうち残すヘッダ
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Retry-After")
+# 設定されていたかを残す環境変数と、値まで残すもの
+ENV_NAMES = (
+    "SPREADSHEET_KEY",
+    "SERVICE_ACCOUNT_JSON",
+    "EDINETDB_API_KEY",
+    "CHANNEL_ACCESS_TOKEN",
+    "USER_ID",
+)
+RECORDED_ENV_VALUES = ("SPREADSHEET_KEY",)
+DUMMY_ENV_VALUE = "replay"
+
+
+class ReplayMiss(requests.ConnectionError):
+    """記録に無い呼び出し（再生ではネットワークに出ないので接続エラーとして扱う）。"""
+
+
+def request_key(method, url, params=None):
+    """照合に使うキー（メソッドとクエリを並べ替えた URL、秘密になりうるクエリは伏せる）。"""
+    if params:
+        url = requests.Request(method, url, params=params).prepare().url
+    parts = urlsplit(url)
+    query = sorted(
+        (name, "-" if name.lower() in REDACTED_PARAMS else value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+    )
+    url = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+    return f"{method.upper()} {url}"
+
+
+def _kept_headers(headers):
+    return {name: headers[name] for name in KEPT_HEADERS if name in headers}
+
+
+class Recorder:
+    """
+    外部呼び出しの応答を貯め、save でバンドルに書き出す。
+
+    Args:
+        bundle (str): バンドルのディレクトリ
+        allow_writes (bool): GET / HEAD 以外の呼び出しも実際に送るか
+    """
+
+    def __init__(self, bundle, allow_writes=False):
+        self.bundle = bundle
+        self.allow_writes = allow_writes
+        self.exchanges = []
+        self.blocked = []
+        self._lock = threading.Lock()
+
+    def blocks(self, method):
+        """この呼び出しを送らずに空の成功応答で済ませるか。"""
+        return not self.allow_writes and method.upper() not in READ_METHODS
+
+    def block(self, key):
+        """送らなかった書き込みの代わりの応答を記録して返す。"""
+        with self._lock:
+            self.blocked.append(key)
+        return self.add(
+            key, BLOCKED_STATUS, BLOCKED_HEADERS, BLOCKED_BODY, encoding="utf-8"
+        )
+
+    def add(self, key, status, headers, body, encoding=None):
+        exchange = {
+            "key": key,
+            "status": status,
+            "headers": _kept_headers(headers),
+            "encoding": encoding,
+            "body": base64.b64encode(body).decode("ascii"),
+        }
+        with self._lock:
+            self.exchanges.append(exchange)
+        return exchange
+
+    def save(self, manifest):
+        os.makedirs(self.bundle, exist_ok=True)
+        path = os.path.join(self.bundle, EXCHANGES)
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            for exchange in self.exchanges:
+                f.write(json.dumps(exchange, ensure_ascii=False) + "\n")
+        os.replace(path + ".tmp", path)
+        manifest = dict(manifest, exchanges=len(self.exchanges))
+        path = os.path.join(self.bundle, MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+class Player:
+    """
+    バンドルから応答を読み、同じキーの呼び出しに記録した順番で返す。
+
+    Args:
+        bundle (str): バンドルのディレクトリ
+    """
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        with open(os.path.join(bundle, MANIFEST), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self._queues = {}
+        self._last = {}
+        with gzip.open(os.path.join(bundle, EXCHANGES), "rt", encoding="utf-8") as f:
+            for line in f:
+                exchange = json.loads(line)
+                self._queues.setdefault(exchange["key"], deque()).append(exchange)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.misses = []
+
+    def take(self, key):
+        """key の次の応答。使い切っていれば最後の応答、記録が無ければ None。"""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            exchange = self._last.get(key)
+            if exchange is None:
+                self.misses.append(key)
+            else:
+                self.served += 1
+            return exchange
+
+    @property
+    def unused(self):
+        """再生で使われなかった応答の数。"""
+        return sum(len(queue) for queue in self._queues.values())
+
+
+def _to_response(exchange, method, url):
+    response = requests.Response()
+    response.status_code = exchange["status"]
+    response.headers = CaseInsensitiveDict(exchange["headers"])
+    response._content = base64.b64decode(exchange["body"])
+    response.encoding = exchange["encoding"]
+    response.url = url
+    response.request = requests.Request(method, url).prepare()
+    return response
+
+
+class _StoredResponse(io.BytesIO):
+    """urlopen の戻り値の代わり（read と with 文、status・headers だけを持つ）。"""
+
+    def __init__(self, url, status, headers, body):
+        super().__init__(body)
+        self.url = url
+        self.status = status
+        self.headers = headers
+
+    def getcode(self):
+        return self.status
+
+
+def _patched_session_request(original, recorder, player):
+    def request(session, method, url, *args, **kwargs):
+        params = kwargs.get("params", args[0] if args else None)
+        key = request_key(method, url, params)
+        if player is not None:
+            exchange = player.take(key)
+            if exchange is None:
+                raise ReplayMiss(f"No recorded response for {key}")
+            return _to_response(exchange, method, url)
+        if urlsplit(url).hostname in PASSTHROUGH_HOSTS:
+            return original(session, method, url, *args, **kwargs)
+        if recorder.blocks(method):
+            return _to_response(recorder.block(key), method, url)
+        response = original(session, method, url, *args, **kwargs)
+        recorder.add(
+            key,
+            response.status_code,
+            response.headers,
+            response.content,
+            encoding=response.encoding,
+        )
+        return response
+
+    return request
+
+
+def _patched_urlopen(original, recorder, player):
+    def urlopen(req, *args, **kwargs):
+        is_request = isinstance(req, urllib.request.Request)
+        url = req.full_url if is_request else req
+        key = request_key(req.get_method() if is_request else "GET", url)
+        if player is not None:
+            exchange = player.take(key)
+            if exchange is None:
+                raise urllib.error.URLError(f"No recorded response for {key}")
+            body = base64.b64decode(exchange["body"])
+            if exchange["status"] >= 400:
+                raise urllib.error.HTTPError(
+                    url, exchange["status"], "", exchange["headers"], io.BytesIO(body)
+                )
+            return _StoredResponse(url, exchange["status"], exchange["headers"], body)
+        if recorder.blocks(req.get_method() if is_request else "GET"):
+            exchange = recorder.block(key)
+            return _StoredResponse(
+                url, exchange["status"], exchange["headers"], BLOCKED_BODY
+            )
+        try:
+            with original(req, *args, **kwargs) as response:
+                body = response.read()
+                status, headers = response.status, dict(response.headers)
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            recorder.add(key, e.code, dict(e.headers or {}), body)
+            raise urllib.error.HTTPError(url, e.code, e.msg, e.headers, io.BytesIO(body))
+        recorder.add(key, status, headers, body)
+        return _StoredResponse(url, status, headers, body)
+
+    return urlopen
+
+
+@contextmanager
+def installed(recorder=None, player=None):
+    """
+    with の間、外部呼び出しを記録（recorder）または再生（player）に差し替える。
+
+    再生では認証を匿名にし、ホストごとのレート制限の待ちも省く。
+    """
+    from google.auth.credentials import AnonymousCredentials
+    from google.oauth2.service_account import Credentials
+
+    from http_fetcher import TokenBucket
+
+    originals = [
+        (requests.Session, "request", requests.Session.request),
+        (urllib.request, "urlopen", urllib.request.urlopen),
+    ]
+    requests.Session.request = _patched_session_request(
+        requests.Session.request, recorder, player
+    )
+    urllib.request.urlopen = _patched_urlopen(urllib.request.urlopen, recorder, player)
+    if player is not None:
+        originals += [
+            (
+                Credentials,
+                "from_service_account_file",
+                Credentials.__dict__["from_service_account_file"],
+            ),
+            (TokenBucket, "acquire", TokenBucket.acquire),
+        ]
+        Credentials.from_service_account_file = classmethod(
+            lambda cls, *args, **kwargs: AnonymousCredentials()
+        )
+        TokenBucket.acquire = lambda self: None
+    try:
+        yield
+    finally:
+        for owner, name, value in reversed(originals):
+            setattr(owner, name, value)
+
+
+def _prepare_env(manifest):
+    """記録時の環境変数の有無を再現する（値は SPREADSHEET_KEY 以外はダミー）。"""
+    values = manifest.get("env", {})
+    present = set(manifest.get("env_present", []))
+    for name in ENV_NAMES:
+        if name in values:
+            os.environ[name] = values[name]
+        elif name in present:
+            os.environ[name] = DUMMY_ENV_VALUE
+        else:
+            # .env が読まれても上書きされないよう空にしておく
+            os.environ[name] = ""
+
+
+def run_chain(state_dir, pick_args):
+    """pick_high_yield_stock.py → note_report.py を作業ディレクトリを指定して実行する。"""
+    import note_report
+    import pick_high_yield_stock
+
+    pick_high_yield_stock.main(
+        ["--no-selenium", "--state-dir", state_dir] + list(pick_args)
+    )
+    note_report.main(["--output-dir", os.path.join(state_dir, "report")])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        epilog="-- の後ろは pick_high_yield_stock.py への引数",
+    )
+    parser.add_argument("mode", choices=("record", "replay"))
+    parser.add_argument("bundle", help="フィクスチャのバンドル（ディレクトリ）")
+    parser.add_argument(
+        "--allow-writes",
+        action="store_true",
+        help="記録で本番のシートへの書き込みと LINE の通知を実際に送る",
+    )
+    # -- の後ろはそのまま pick_high_yield_stock.py に渡す（--allow-writes を飲み込まないよう分ける）
+    argv = list(sys.argv[1:] if argv is None else argv)
+    split = argv.index("--") if "--" in argv else len(argv)
+    args = parser.parse_args(argv[:split])
+    pick_args = argv[split + 1 :]
+
+    # 作業ディレクトリは毎回空から作る（キャッシュの有無で呼び出しが変わらないように）
+    state_dir = os.path.join(args.bundle, f"{args.mode}-state")
+    shutil.rmtree(state_dir, ignore_errors=True)
+    os.makedirs(state_dir)
+
+    recorder = player = None
+    if args.mode == "replay":
+        player = Player(args.bundle)
+        _prepare_env(player.manifest)
+    else:
+        recorder = Recorder(args.bundle, allow_writes=args.allow_writes)
+
+    start_time = time.time()
+    status = "ok"
+    try:
+        with installed(recorder, player):
+            run_chain(state_dir, pick_args)
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        if recorder is not None:
+            recorder.save(
+                {
+                    "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                    "status": status,
+                    "pick_args": pick_args,
+                    "writes_allowed": recorder.allow_writes,
+                    "python": sys.version.split()[0],
+                    "env": {
+                        name: os.environ[name]
+                        for name in RECORDED_ENV_VALUES
+                        if os.getenv(name)
+                    },
+                    "env_present": [name for name in ENV_NAMES if os.getenv(name)],
+                }
+            )
+            print(f"記録: {len(recorder.exchanges)}件 → {args.bundle}")
+            if recorder.blocked:
+                print(
+                    f"送らなかった書き込み: {len(recorder.blocked)}件"
+                    "（本番に書くときは --allow-writes）"
+                )
+        if player is not None:
+            print(
+                f"再生: {player.served}件 / 記録に無い呼び出し: {len(player.misses)}件 / "
+                f"未使用の応答: {player.unused}件"
+            )
+            for key in sorted(set(player.misses)):
+                print(f"  [miss] {key}")
+        print(f"{args.mode} の実行時間: {time.time() - start_time:.2f}秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""スプレッドシートの4タブ（購入履歴 / 時価総額 / 配当推移 / 今週の銘柄）のローカル SQLite ミラー。
+
+レポート・バックテスト・手元の集計のたびに get_all_values でシートを読み直さずに済むよう、
+各タブを同名のテーブルに型付きの列で保存する（1行目の見出しが列名、
+_row はシート上の行番号）。日付と証券コードの列には索引を張る。
+
+- 書き込みの反映: SheetsGateway に mirror を渡すと、flush で送った置き換え・追記を
+  同じ内容でミラーにも書く（ミラーが最新でないタブは次の sync で取り直す）
+- 同期: sync はスプレッドシートの最終更新日時（Drive の modifiedTime）を保存値と比べ、
+  変わっていた時だけ4タブを values_batch_get（書式なしと表示形式の2回）で読み直す
+
+読み出しの get_all_values は gspread と同じ「文字列の行のリスト」を返すので、
+シートを読むコードをそのまま（API 呼び出しなしで）ミラーに向けられる。
+型付きの列から文字列を作り直すとシートの表示形式（桁区切り・日付・小数の桁など）と
+ずれるため、同期時に表示形式（FORMATTED_VALUE）の値をタブごとにそのまま保存して返す。
+書き込みを反映したタブは表示形式の値が分からないので保存値を捨て、次の sync で
+（最終更新日時が同じでも）そのタブだけ表示形式の値を読み直す。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+from instrumentation import span
+from sheets_gateway import FORMATTED, TABS, UNFORMATTED, fill_gaps
+
+MIRROR_PATH = "/home/taru-boy/Desktop/get_stock/cache/sheet_mirror.sqlite3"
+
+# 列名ごとの型（載っていない列は TEXT）。日付は ISO 形式の文字列で持つ。
+COLUMN_TYPES = {
+    "日付": "DATE",
+    "証券コード": "TEXT",
+    "取得単価": "REAL",
+    "株価": "REAL",
+    "株数": "INTEGER",
+    "合計株数": "INTEGER",
+    "時価総額": "INTEGER",
+    "配当利回り(%)": "REAL",
+    "総年間配当(円)": "INTEGER",
+    "総時価総額(円)": "INTEGER",
+}
+INDEXED_COLUMNS = ("日付", "証券コード")
+SHEETS_EPOCH = date(1899, 12, 30)  # シートの日付シリアル値の起点
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _column_names(header):
+    """見出しを SQL の列名にする（空・重複の見出しは「列N」に置き換える）。"""
+    names = []
+    for i, name in enumerate(header):
+        if not name or name == "_row" or name in names:
+            name = f"列{i + 1}"
+        names.append(name)
+    return names
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).replace(",", "").replace("¥", "").replace("円", "").strip()
+    if not text:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def to_column_value(value, column_type):
+    """シートの値（書式なし）を列の型に合わせて変換する。変換できなければ文字列のまま。"""
+    if value is None or value == "":
+        return None
+    if column_type == "DATE":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return (SHEETS_EPOCH + timedelta(days=int(value))).isoformat()
+        return str(value)
+    if column_type in ("INTEGER", "REAL"):
+        number = _to_number(value)
+        if number is None:
+            return str(value)
+        if column_type == "INTEGER" and float(number).is_integer():
+            return int(number)
+        return float(number) if column_type == "REAL" else number
+    if isinstance(value, float) and value.is_integer():
+        # 証券コードなどの数値セルを "1234.0" ではなく "1234" として持つ
+        return str(int(value))
+    return str(value)
+
+
+def to_display(value):
+    """
+    ミラーの値を文字列にする（表示形式の値が無いタブの近似用）。
+
+    シートの表示形式（桁区切り・日付・小数の桁など）は再現しないので、
+    get_all_values と同じ文字列になるとは限らない。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class SheetMirror:
+    """
+    スプレッドシートのタブを SQLite に写したミラー。
+
+    Args:
+        path (str): SQLite ファイル
+        tabs (tuple): 写すタブ名
+    """
+
+    def __init__(self, path=MIRROR_PATH, tabs=TABS):
+        self.path = path
+        self.tabs = tabs
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_tabs ("
+            " title TEXT PRIMARY KEY, header TEXT NOT NULL, rows INTEGER NOT NULL)"
+        )
+        # タブごとの表示形式の値（get_all_values がそのまま返す JSON）
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS _mirror_display ("
+            " title TEXT PRIMARY KEY, display TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    # --- メタデータ ---------------------------------------------------------
+
+    @property
+    def revision(self):
+        """最後に同期したスプレッドシートの最終更新日時（未同期なら None）。"""
+        row = self._conn.execute(
+            "SELECT value FROM _mirror_meta WHERE key = 'revision'"
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_revision(self, revision):
+        if revision is None:
+            self._conn.execute("DELETE FROM _mirror_meta WHERE key = 'revision'")
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO _mirror_meta (key, value) VALUES ('revision', ?)",
+                (revision,),
+            )
+
+    def _tab_info(self, title):
+        row = self._conn.execute(
+            "SELECT header, rows FROM _mirror_tabs WHERE title = ?", (title,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0].split("\t"), row[1]
+
+    def has_tab(self, title):
+        return self._tab_info(title) is not None
+
+    def _display(self, title):
+        row = self._conn.execute(
+            "SELECT display FROM _mirror_display WHERE title = ?", (title,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_display(self, title, display):
+        if display is None:
+            self._conn.execute("DELETE FROM _mirror_display WHERE title = ?", (title,))
+        else:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO _mirror_display (title, display) VALUES (?, ?)",
+                (title, json.dumps(display, ensure_ascii=False)),
+            )
+
+    # --- 書き込み -----------------------------------------------------------
+
+    def _create_table(self, title, header):
+        table = _quote(title)
+        self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+        columns = ["_row INTEGER PRIMARY KEY"] + [
+            f"{_quote(name)} {COLUMN_TYPES.get(name, 'TEXT')}"
+            for name in _column_names(header)
+        ]
+        self._conn.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+        for name in INDEXED_COLUMNS:
+            if name in header:
+                self._conn.execute(
+                    f"CREATE INDEX {_quote(f'{title}_{name}')} ON {table} ({_quote(name)})"
+                )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO _mirror_tabs (title, header, rows) VALUES (?, ?, 0)",
+            (title, "\t".join(header)),
+        )
+
+    def _insert(self, title, header, start_row, rows):
+        """シートの start_row 行目からの rows（見出しを除く）を挿入する。"""
+        types = [COLUMN_TYPES.get(name, "TEXT") for name in header]
+        records = []
+        for offset, row in enumerate(rows):
+            cells = list(row)[: len(header)] + [None] * (len(header) - len(row))
+            records.append(
+                [start_row + offset]
+                + [to_column_value(value, kind) for value, kind in zip(cells, types)]
+            )
+        if records:
+            placeholders = ", ".join("?" * (len(header) + 1))
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {_quote(title)} VALUES ({placeholders})",
+                records,
+            )
+        self._conn.execute(
+            "UPDATE _mirror_tabs SET rows = ? WHERE title = ?",
+            (start_row + len(rows) - 1 if header else 0, title),
+        )
+
+    def replace_tab(self, title, values, display=None):
+        """
+        タブ全体（見出し込みの値）でテーブルを作り直す。
+
+        display には同じ範囲の表示形式の値を渡す（書き込みの反映など、
+        分からない時は None にすると次の sync で読み直す）。
+        """
+        if title not in self.tabs:
+            return
+        header = [str(name) for name in values[0]] if values else []
+        with self._lock:
+            self._create_table(title, header)
+            self._insert(title, header, 2, values[1:])
+            self._set_display(title, display)
+            self._conn.commit()
+
+    def append_rows(self, title, start_row, rows):
+        """
+        シートの start_row 行目からの追記を反映する。
+
+        ミラーの行数と追記位置が合わない（ミラーが古い）場合は反映せず、
+        次の sync で取り直すよう同期済みの印を消す。
+        """
+        if title not in self.tabs:
+            return
+        with self._lock:
+            info = self._tab_info(title)
+            # 追記後の表示形式の値は分からないので、次の sync で読み直す
+            self._set_display(title, None)
+            if start_row == 1:
+                # 空のタブへの追記は見出しから始まる
+                self._create_table(title, [str(name) for name in rows[0]])
+                self._insert(title, [str(name) for name in rows[0]], 2, rows[1:])
+            elif info is not None and info[1] == start_row - 1:
+                self._insert(title, info[0], start_row, rows)
+            else:
+                self._set_revision(None)
+            self._conn.commit()
+
+    def mark_synced(self, revision):
+        """書き込みを反映し終えた時点のスプレッドシートの最終更新日時を記録する。"""
+        with self._lock:
+            self._set_revision(revision)
+            self._conn.commit()
+
+    def invalidate(self):
+        """次の sync で必ず取り直すようにする。"""
+        self.mark_synced(None)
+
+    # --- 同期 ---------------------------------------------------------------
+
+    def sync(self, gateway, force=False):
+        """
+        スプレッドシートの最終更新日時が変わっていれば全タブを読み直す。
+
+        更新日時が同じでも、書き込みを反映して表示形式の値を捨てたタブがあれば、
+        そのタブの表示形式の値だけを読み直す。
+
+        Args:
+            gateway (SheetsGateway): 開いているスプレッドシート
+            force (bool): 更新日時が同じでも読み直すか
+
+        Returns:
+            bool: 全タブを読み直した場合 True
+        """
+        with span("sheets", "get_lastUpdateTime") as api_span:
+            revision = gateway.spreadsheet.get_lastUpdateTime()
+            api_span.add(requests=1)
+        if not force and revision == self.revision:
+            stale = [
+                title
+                for title in self.tabs
+                if self.has_tab(title) and self._display(title) is None
+            ]
+            if stale:
+                gateway.prefetch([(title, None) for title in stale], FORMATTED)
+                with self._lock:
+                    for title in stale:
+                        self._set_display(title, gateway.get(title) or [])
+                    self._conn.commit()
+            return False
+        keys = [(title, None) for title in self.tabs]
+        gateway.prefetch(keys, UNFORMATTED)
+        gateway.prefetch(keys, FORMATTED)
+        for title in self.tabs:
+            values = gateway.get(title, render=UNFORMATTED)
+            if values is None:
+                with self._lock:
+                    self._conn.execute(f"DROP TABLE IF EXISTS {_quote(title)}")
+                    self._conn.execute(
+                        "DELETE FROM _mirror_tabs WHERE title = ?", (title,)
+                    )
+                    self._set_display(title, None)
+                continue
+            self.replace_tab(title, values, display=gateway.get(title) or [])
+        self.mark_synced(revision)
+        return True
+
+    # --- 読み出し -----------------------------------------------------------
+
+    def get_all_values(self, title):
+        """
+        タブの値を gspread の get_all_values と同じ形（文字列の行のリスト）で返す。
+        ミラーに無いタブは None。
+
+        同期時に保存した表示形式の値があればそれを返す（シートと同じ文字列）。
+        書き込みを反映した後まだ sync していないタブだけは、型付きの列から作った
+        近似の文字列になる。
+        """
+        info = self._tab_info(title)
+        if info is None:
+            return None
+        with self._lock:
+            display = self._display(title)
+        if display is not None:
+            return fill_gaps(display)
+        header, _ = info
+        if not header:
+            return []
+        columns = ", ".join(_quote(name) for name in _column_names(header))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT _row, {columns} FROM {_quote(title)} ORDER BY _row"
+            ).fetchall()
+        values = [header]
+        for row in rows:
+            # 途中の空行もシートと同じ位置に残す
+            while len(values) < row[0] - 1:
+                values.append([""] * len(header))
+            values.append([to_display(value) for value in row[1:]])
+        return values
+
+    def query(self, sql, params=()):
+        """ミラーに対して任意の SELECT を実行する（手元の集計用）。"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,409 @@
+"""Google スプレッドシートへの読み書きを1回の実行でまとめて行うゲートウェイ。
+
+タブごとに open_by_key → worksheet → get_all_values / clear / update / append_row を
+呼ぶと、1回の実行で数十回の API 呼び出しになり、分あたりのクォータに近づく。
+ここではスプレッドシートを一度だけ開き（メタデータ取得込み）、
+
+- 読み込み: 必要な範囲を prefetch でまとめて1回の values_batch_get
+- 書き込み: replace / append を実行中はキューに積み、flush で
+  batch_update（タブ追加・行列の拡張）→ values_batch_clear → values_batch_update（RAW）
+  の高々3回で送る
+
+ようにする。値の書式は gspread の get_all_values / update / append_row と同じ
+（読み込みは表示形式の文字列、書き込みは RAW）。
+
+replace は clear → 全体の書き直しではなく、flush の直前に置き換えるタブの現在の値を
+書式なし（UNFORMATTED_VALUE、RAW で書いた値と同じ型）でまとめて読み、
+変わったセルを含む範囲だけを書く。行が減った分は末尾の行だけを消し、
+列が減った分は空文字で上書きする。タブが空になる瞬間も無くなる。
+"""
+
+import logging
+
+from gspread.utils import rowcol_to_a1
+
+from instrumentation import span
+
+TABS = ("購入履歴", "時価総額", "配当推移", "今週の銘柄")
+VALUE_INPUT_OPTION = "RAW"
+FORMATTED = "FORMATTED_VALUE"  # get_all_values と同じ表示形式の文字列
+UNFORMATTED = "UNFORMATTED_VALUE"  # RAW で書いた値と比べるための書式なしの値
+
+
+def a1_range(title, a1=None):
+    """タブ名（引用符付き）と A1 表記から範囲文字列を作る。a1 が None ならタブ全体。"""
+    quoted = "'{}'".format(title.replace("'", "''"))
+    return quoted if a1 is None else f"{quoted}!{a1}"
+
+
+def fill_gaps(values, width=0):
+    """行の長さを最も長い行（と width の大きい方）に揃える（get_all_values と同じ形）。"""
+    width = max([width] + [len(row) for row in values])
+    return [list(row) + [""] * (width - len(row)) for row in values]
+
+
+def _same_cell(old, new):
+    """書式なしで読んだ値 old と、RAW で書く値 new が同じセル内容か。"""
+    if old is None:
+        old = ""
+    if new is None:
+        new = ""
+    numbers = (int, float)
+    if (
+        isinstance(old, numbers)
+        and isinstance(new, numbers)
+        and not isinstance(old, bool)
+        and not isinstance(new, bool)
+    ):
+        return float(old) == float(new)
+    return type(old) is type(new) and old == new
+
+
+def diff_ranges(old, new):
+    """
+    今の値 old から new に置き換えるための最小限の書き込み・消去範囲を求める。
+
+    変わったセルを含む連続した行をまとめ、その行たちで変わった列の範囲
+    （最左〜最右）を1つの矩形として書く。new が短くなった分の末尾の行は消去、
+    行内で短くなった分の列は空文字で上書きする。
+
+    Args:
+        old (list): 現在の値（書式なし、末尾の空セル・空行は省かれていてよい）
+        new (list): 置き換え後の値（見出し込み）
+
+    Returns:
+        tuple: (writes, clears)
+            - writes (list): (開始行, 開始列, 値の矩形) のリスト（行・列は1始まり）
+            - clears (list): 消去する A1 範囲（タブ名なし）のリスト
+    """
+    width = max([len(row) for row in old] + [len(row) for row in new] + [0])
+    old_rows = fill_gaps(old, width)
+    new_rows = fill_gaps(new, width)
+
+    spans = []  # (行番号0始まり, 最左列, 最右列)
+    for i, new_row in enumerate(new_rows):
+        old_row = old_rows[i] if i < len(old_rows) else [""] * width
+        changed = [
+            j for j in range(width) if not _same_cell(old_row[j], new_row[j])
+        ]
+        if changed:
+            spans.append((i, changed[0], changed[-1]))
+
+    # 隣り合う行をまとめる: [最初の行, 最後の行, 最左列, 最右列]
+    blocks = []
+    for i, lo, hi in spans:
+        if blocks and blocks[-1][1] == i - 1:
+            block = blocks[-1]
+            block[1] = i
+            block[2] = min(block[2], lo)
+            block[3] = max(block[3], hi)
+        else:
+            blocks.append([i, i, lo, hi])
+    writes = [
+        (first + 1, left + 1, [row[left : right + 1] for row in new_rows[first : last + 1]])
+        for first, last, left, right in blocks
+    ]
+
+    clears = []
+    if len(old) > len(new):
+        clears.append(f"{len(new) + 1}:{len(old)}")
+    return writes, clears
+
+
+class _TabView:
+    """
+    1タブ分の読み込みをゲートウェイ経由にする、gspread.Worksheet 互換の最小限の窓口。
+
+    batch_get / get_all_values だけを持ち、先読み済みの範囲は API を呼ばずに返す。
+    """
+
+    def __init__(self, gateway, title):
+        self.gateway = gateway
+        self.title = title
+
+    def batch_get(self, ranges):
+        keys = [(self.title, a1) for a1 in ranges]
+        self.gateway.prefetch(keys)
+        return [self.gateway.get(self.title, a1) for a1 in ranges]
+
+    def get_all_values(self):
+        return self.gateway.get_all_values(self.title)
+
+
+class SheetsGateway:
+    """
+    スプレッドシートを一度だけ開き、読み込みを先読み・書き込みをまとめ送りする。
+
+    Args:
+        gc (gspread.Client): 認証済みのクライアント
+        spreadsheet_key (str): スプレッドシートのキー
+        mirror (SheetMirror): 書き込みを同じ内容で反映するローカルミラー（任意）
+    """
+
+    def __init__(self, gc, spreadsheet_key, mirror=None):
+        with span("sheets", "open_by_key") as api_span:
+            self.spreadsheet = gc.open_by_key(spreadsheet_key)
+            api_span.add(requests=1)
+        self.mirror = mirror
+        self._mirror_synced = False
+        with span("sheets", "fetch_sheet_metadata") as api_span:
+            metadata = self.spreadsheet.fetch_sheet_metadata()
+            api_span.add_payload(metadata)
+        # タブ名 → シートのプロパティ（sheetId・行数・列数）
+        self._sheets = {
+            sheet["properties"]["title"]: sheet["properties"]
+            for sheet in metadata["sheets"]
+        }
+        self._values = {}  # (タブ名, A1 or None, 書式) → 読み込んだ値
+        self._row_counts = {}  # タブ名 → 値の入っている最終行
+        self._new_tabs = {}  # タブ名 → (行数, 列数)
+        self._replaces = {}  # タブ名 → 置き換え後の値（flush で差分にする）
+        self._writes = []  # (タブ名, 開始行, 開始列, 値の矩形)
+
+    def has_tab(self, title):
+        return title in self._sheets or title in self._new_tabs
+
+    def sync_mirror(self, force=False):
+        """
+        ミラーをスプレッドシートの最終更新日時で同期する（変わっていなければ読まない）。
+
+        同期できた実行では、flush 後にミラーの最終更新日時も書き込み後の値に進める。
+
+        Returns:
+            bool: 読み直した場合 True
+        """
+        if self.mirror is None:
+            return False
+        reloaded = self.mirror.sync(self, force=force)
+        self._mirror_synced = True
+        return reloaded
+
+    def prefetch(self, keys, render=FORMATTED):
+        """
+        (タブ名, A1 or None) の並びをまだ読んでいない分だけ1回の values_batch_get で読む。
+
+        存在しないタブの範囲は読まずに None として扱う（1つでも混ざると一括取得が失敗するため）。
+        render は値の書式（FORMATTED / UNFORMATTED）で、1回の取得につき1種類。
+        """
+        missing = []
+        for title, a1 in keys:
+            key = (title, a1, render)
+            if key in self._values or key in missing:
+                continue
+            if title not in self._sheets:
+                self._values[key] = None
+                continue
+            missing.append(key)
+        if not missing:
+            return
+        params = None if render == FORMATTED else {"valueRenderOption": render}
+        with span("sheets", "values_batch_get") as api_span:
+            response = self.spreadsheet.values_batch_get(
+                [a1_range(title, a1) for title, a1, _ in missing], params=params
+            )
+            api_span.add_payload(response)
+        for key, value_range in zip(missing, response.get("valueRanges", [])):
+            self._values[key] = value_range.get("values", [])
+
+    def get(self, title, a1=None, render=FORMATTED):
+        """範囲の値（末尾の空セル・空行は省かれた形）。タブが無ければ None。"""
+        self.prefetch([(title, a1)], render)
+        return self._values[(title, a1, render)]
+
+    def get_all_values(self, title):
+        """タブ全体の値（get_all_values と同じく各行の長さを揃える）。タブが無ければ None。"""
+        values = self.get(title)
+        return None if values is None else fill_gaps(values)
+
+    def worksheet(self, title):
+        """holdings_ledger などに渡す、読み込み用の gspread.Worksheet 互換オブジェクト。"""
+        return _TabView(self, title)
+
+    def set_row_count(self, title, rows):
+        """値の入っている最終行が分かっている場合に教える（append 用の A列の読み込みを省く）。"""
+        self._row_counts[title] = rows
+
+    def _row_count(self, title):
+        if title not in self._row_counts:
+            if title in self._new_tabs:
+                self._row_counts[title] = 0
+            elif (title, None, FORMATTED) in self._values:
+                self._row_counts[title] = len(self._values[(title, None, FORMATTED)] or [])
+            else:
+                self._row_counts[title] = len(self.get(title, "A:A") or [])
+        return self._row_counts[title]
+
+    def add_tab(self, title, rows, cols):
+        """タブを追加する（flush でまとめて作る）。"""
+        if not self.has_tab(title):
+            self._new_tabs[title] = (rows, cols)
+
+    def replace(self, title, values):
+        """タブの内容を values（見出し込みの行のリスト）で置き換える（変わったセルだけ書く）。"""
+        if not self.has_tab(title):
+            self.add_tab(title, len(values), max((len(row) for row in values), default=1))
+        self._replaces[title] = values
+        self._row_counts[title] = len(values)
+
+    def append(self, title, rows):
+        """タブの最終行の下に rows を追記する（append_row と同じく RAW）。"""
+        if not rows:
+            return
+        start = self._row_count(title) + 1
+        self._writes.append((title, start, 1, rows))
+        self._row_counts[title] = start + len(rows) - 1
+
+    def _replace_ranges(self):
+        """
+        置き換えるタブの今の値を書式なしで1回で読み、差分の書き込み・消去範囲にする。
+
+        Returns:
+            tuple: (writes, clears) — writes は (タブ名, 開始行, 開始列, 値の矩形)、
+                clears はタブ名付きの A1 範囲
+        """
+        existing = [title for title in self._replaces if title in self._sheets]
+        self.prefetch([(title, None) for title in existing], UNFORMATTED)
+        writes = []
+        clears = []
+        for title, values in self._replaces.items():
+            current = self._values.get((title, None, UNFORMATTED)) or []
+            tab_writes, tab_clears = diff_ranges(current, values)
+            writes += [(title,) + write for write in tab_writes]
+            clears += [a1_range(title, a1) for a1 in tab_clears]
+        return writes, clears
+
+    def _grid_requests(self, writes):
+        """書き込み範囲に足りないタブの追加・行列の拡張リクエスト。"""
+        needed = {}
+        for title, row, col, values in writes:
+            rows, cols = needed.get(title, (0, 0))
+            width = max((len(line) for line in values), default=0)
+            needed[title] = (
+                max(rows, row + len(values) - 1),
+                max(cols, col + width - 1),
+            )
+
+        requests = []
+        for title, (rows, cols) in self._new_tabs.items():
+            need_rows, need_cols = needed.get(title, (0, 0))
+            requests.append(
+                {
+                    "addSheet": {
+                        "properties": {
+                            "title": title,
+                            "gridProperties": {
+                                "rowCount": max(rows, need_rows, 1),
+                                "columnCount": max(cols, need_cols, 1),
+                            },
+                        }
+                    }
+                }
+            )
+        for title, (need_rows, need_cols) in needed.items():
+            properties = self._sheets.get(title)
+            if properties is None:
+                continue
+            grid = properties.get("gridProperties", {})
+            for dimension, have, need in (
+                ("ROWS", grid.get("rowCount", 0), need_rows),
+                ("COLUMNS", grid.get("columnCount", 0), need_cols),
+            ):
+                if need > have:
+                    requests.append(
+                        {
+                            "appendDimension": {
+                                "sheetId": properties["sheetId"],
+                                "dimension": dimension,
+                                "length": need - have,
+                            }
+                        }
+                    )
+        return requests
+
+    def _write_through(self):
+        """送った置き換え・追記をミラーにも反映する。最終更新日時を取り直した回数を返す。"""
+        for title, values in self._replaces.items():
+            self.mirror.replace_tab(title, values)
+        for title, row, _, values in self._writes:
+            self.mirror.append_rows(title, row, values)
+        if self._mirror_synced and self.mirror.revision is not None:
+            with span("sheets", "get_lastUpdateTime") as api_span:
+                revision = self.spreadsheet.get_lastUpdateTime()
+                api_span.add(requests=1)
+            self.mirror.mark_synced(revision)
+            return 1
+        return 0
+
+    def flush(self):
+        """
+        キューに積んだ書き込みをまとめて送る。
+
+        Returns:
+            int: 送った API 呼び出しの回数（差分を取るための読み込みは含まない）
+        """
+        calls = 0
+        replace_writes, clears = self._replace_ranges()
+        writes = replace_writes + self._writes
+
+        requests = self._grid_requests(writes)
+        if requests:
+            body = {"requests": requests}
+            with span("sheets", "batch_update") as api_span:
+                response = self.spreadsheet.batch_update(body)
+                api_span.add_payload(body)
+            calls += 1
+            for reply in response.get("replies", []):
+                properties = reply.get("addSheet", {}).get("properties")
+                if properties:
+                    self._sheets[properties["title"]] = properties
+            # 拡張後の大きさはメタデータを取り直さず手元で合わせる
+            for request in requests:
+                append = request.get("appendDimension")
+                if append is None:
+                    continue
+                for properties in self._sheets.values():
+                    if properties.get("sheetId") == append["sheetId"]:
+                        grid = properties.setdefault("gridProperties", {})
+                        key = "rowCount" if append["dimension"] == "ROWS" else "columnCount"
+                        grid[key] = grid.get(key, 0) + append["length"]
+        self._new_tabs = {}
+
+        if clears:
+            with span("sheets", "values_batch_clear") as api_span:
+                self.spreadsheet.values_batch_clear(body={"ranges": clears})
+                api_span.add_payload(clears)
+            calls += 1
+        if writes:
+            body = {
+                "valueInputOption": VALUE_INPUT_OPTION,
+                "data": [
+                    {
+                        "range": a1_range(title, rowcol_to_a1(row, col)),
+                        "values": values,
+                    }
+                    for title, row, col, values in writes
+                ],
+            }
+            with span("sheets", "values_batch_update") as api_span:
+                self.spreadsheet.values_batch_update(body=body)
+                api_span.add_payload(body)
+            calls += 1
+        if self.mirror is not None and (self._replaces or self._writes):
+            # シートへの書き込みは済んでいるので、ミラーの失敗では止めない
+            try:
+                calls += self._write_through()
+            except Exception as e:
+                logging.warning(f"Could not write through to sheet mirror: {e}")
+                try:
+                    self.mirror.invalidate()
+                except Exception:
+                    pass
+
+        # 書き込んだタブの先読み値は古くなるので捨てる
+        written = set(self._replaces) | {write[0] for write in writes}
+        self._values = {
+            key: value for key, value in self._values.items() if key[0] not in written
+        }
+        self._replaces = {}
+        self._writes = []
+        return calls
@@ -1,27 +1,102 @@
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
 
 
+HEAD_WINDOW = 20  # 利回り上位から見る行数（重複排除前）
+TOP_N = 10  # 重複排除後に残す銘柄数
+STOCK_CAP_RATIO = 0.04  # 保有セクター内選定: 1銘柄の時価総額の上限（全体比）
+SECTOR_CAP_RATIO = 0.2  # 保有セクター内選定: セクターの時価総額の上限（全体比、未満）
+PICKS_PER_WEEK = 2  # 毎週選ぶ銘柄数
+LOT_YEN = 10000  # 1銘柄あたりの購入額（これ以上になるよう株数を切り上げ）
+
+
+class CandidateIndex:
+    """
+    df_stocks から一度だけ組み立てる候補銘柄の索引。
+
+    各選定関数が毎回作り直していた「利回り上位20→重複排除→上位10」の表、
+    複数指数の重複銘柄（value_counts）の表、保有セクター内選定用の和集合を保持する。
+    各表は (証券コード文字列, セクター, 表内の行位置) の並びとしても持つので、
+    n 銘柄を選ぶ反復は DataFrame を作り直さずに済む（行は選んだ時だけ取り出す）。
+    保有セクター内選定用の和集合は、その段階まで進んだ時に初めて作る。
+
+    Args:
+        df_stocks (pd.DataFrame): 配当利回り降順の全指数の銘柄表
+        head_window (int): 利回り上位から見る行数
+        top_n (int): 重複排除後に残す銘柄数
+    """
+
+    def __init__(self, df_stocks, head_window=HEAD_WINDOW, top_n=TOP_N):
+        self.df_stocks = df_stocks
+
+        df_yield = df_stocks.head(head_window)
+        df_yield = df_yield.drop_duplicates(subset=["証券コード"], keep="first")
+        self.df_yield = df_yield.head(top_n)
+
+        duplicate_codes = df_stocks["証券コード"].value_counts()
+        self.duplicate_codes = duplicate_codes[duplicate_codes > 1]
+        df_duplicates = df_stocks[
+            df_stocks["証券コード"].isin(self.duplicate_codes.index)
+        ]
+        self.df_duplicates = df_duplicates.drop_duplicates(
+            subset=["証券コード"], keep="first"
+        )
+
+        self.yield_rows = self._rows(self.df_yield)
+        self.duplicate_rows = self._rows(self.df_duplicates)
+
+    @staticmethod
+    def _rows(df):
+        return list(
+            zip(
+                [str(code) for code in df["証券コード"]],
+                df["セクター"].tolist(),
+                range(len(df)),
+            )
+        )
+
+    @cached_property
+    def df_sector_candidates(self):
+        """保有セクター内選定の候補（上位10と重複銘柄の和集合、URL・指数列なし）。"""
+        temp_df = pd.concat([self.df_yield, self.df_duplicates], ignore_index=True)
+        temp_df = temp_df.drop(columns=["URL", "指数"], errors="ignore")
+        return temp_df.drop_duplicates(subset=["証券コード"], keep="first")
+
+    @cached_property
+    def sector_candidate_rows(self):
+        return self._rows(self.df_sector_candidates)
+
+    def candidate_codes(self):
+        """「上位10」と「重複銘柄」の和集合（重複排除、並びは上位10→重複銘柄）。"""
+        codes = pd.concat(
+            [self.df_yield["証券コード"], pd.Series(self.duplicate_codes.index)],
+            ignore_index=True,
+        )
+        return list(codes.drop_duplicates())
+
+
+def _as_candidate_index(df_stocks):
+    if isinstance(df_stocks, CandidateIndex):
+        return df_stocks
+    return CandidateIndex(df_stocks)
+
+
 def candidate_codes(df_stocks):
     """
     選定アルゴリズムが実際に評価する候補銘柄の証券コードを返す。
 
     「利回り上位20→重複排除→上位10」と「複数指数の重複銘柄」の和集合（重複排除）。
-    減配チェックのAPIリクエストをこの候補集合に限定するために使う。
+    減配チェックをこの候補集合だけに絞りたい時（手元での確認など）に使う。
+
+    Args:
+        df_stocks (pd.DataFrame | CandidateIndex): 銘柄表、または構築済みの索引
 
     Returns:
         list: 証券コードのリスト（重複排除済み）
     """
-    df_yield = df_stocks.head(20)
-    df_yield = df_yield.drop_duplicates(subset=["証券コード"], keep="first")
-    df_yield = df_yield.head(10)
-
-    duplicate_codes = df_stocks["証券コード"].value_counts()
-    duplicate_codes = duplicate_codes[duplicate_codes > 1]
-
-    codes = pd.concat(
-        [df_yield["証券コード"], pd.Series(duplicate_codes.index)], ignore_index=True
-    )
-    return list(codes.drop_duplicates())
+    return _as_candidate_index(df_stocks).candidate_codes()
 
 
 def pick_stock_by_yield(df_stocks, held_sector, cut_codes=frozenset()):
@@ -29,14 +104,12 @@ def pick_stock_by_yield(df_stocks, held_sector, cut_codes=frozenset()):
     重複銘柄も考慮して、配当利回り上位10銘柄から未保有セクターの銘柄を選定する。
     来期減配予想の銘柄は除外する。
     """
-    df_yield = df_stocks.head(20)
-    df_yield = df_yield.drop_duplicates(subset=["証券コード"], keep="first")
-    df_yield = df_yield.head(10)
-    for _, stock in df_yield.iterrows():
-        if str(stock["証券コード"]) in cut_codes:
+    index = _as_candidate_index(df_stocks)
+    for code, sector, position in index.yield_rows:
+        if code in cut_codes:
             continue
-        if stock["セクター"] not in held_sector:
-            return stock
+        if sector not in held_sector:
+            return index.df_yield.iloc[position]
     return None
 
 
@@ -45,57 +118,103 @@ def pick_stock_by_duplicates(df_stocks, held_sector, cut_codes=frozenset()):
     複数指数に重複カウントされている銘柄から未保有セクターの銘柄を選定する。
     来期減配予想の銘柄は除外する。
     """
-    duplicate_codes = df_stocks["証券コード"].value_counts()
-    duplicate_codes = duplicate_codes[duplicate_codes > 1]
-    df_duplicates = df_stocks[df_stocks["証券コード"].isin(duplicate_codes.index)]
-    df_duplicates = df_duplicates.drop_duplicates(subset=["証券コード"], keep="first")
-
-    for _, stock in df_duplicates.iterrows():
-        if str(stock["証券コード"]) in cut_codes:
+    index = _as_candidate_index(df_stocks)
+    for code, sector, position in index.duplicate_rows:
+        if code in cut_codes:
             continue
-        if stock["セクター"] not in held_sector:
-            return stock
+        if sector not in held_sector:
+            return index.df_duplicates.iloc[position]
     return None
 
 
-def pick_stock_in_holding_sector(df_stocks, df_latest_holdings, cut_codes=frozenset()):
+class HoldingWeights:
+    """
+    保有銘柄の時価総額を、証券コード別・セクター別に一度だけ集計した辞書。
+
+    保有セクター内選定で候補ごとに保有表全体を絞り込んでいたのを、
+    辞書引き＋配列のマスクで済ませるために使う。証券コードは文字列で引く。
+
+    Args:
+        code_caps (dict): 証券コード（str）→ 時価総額
+        sector_caps (dict): セクター → 時価総額
+        total_cap (float): 全保有の時価総額
+    """
+
+    def __init__(self, code_caps, sector_caps, total_cap):
+        self.code_caps = code_caps
+        self.sector_caps = sector_caps
+        self.total_cap = total_cap
+
+    @classmethod
+    def from_holdings(cls, df_latest_holdings):
+        """「時価総額」シート相当の保有表（証券コード・セクター・時価総額）から作る。"""
+        if df_latest_holdings.empty or "時価総額" not in df_latest_holdings:
+            return cls({}, {}, 0)
+        caps = df_latest_holdings["時価総額"]
+        code_caps = caps.groupby(df_latest_holdings["証券コード"].astype(str)).sum()
+        sector_caps = caps.groupby(df_latest_holdings["セクター"]).sum()
+        return cls(code_caps.to_dict(), sector_caps.to_dict(), caps.sum())
+
+
+def _as_holding_weights(df_latest_holdings):
+    if isinstance(df_latest_holdings, HoldingWeights):
+        return df_latest_holdings
+    return HoldingWeights.from_holdings(df_latest_holdings)
+
+
+def pick_stock_in_holding_sector(
+    df_stocks,
+    df_latest_holdings,
+    cut_codes=frozenset(),
+    stock_cap_ratio=STOCK_CAP_RATIO,
+    sector_cap_ratio=SECTOR_CAP_RATIO,
+):
     """
     対象銘柄の保有比率が高すぎない範囲で高配当銘柄を選定する。
     来期減配予想の銘柄は除外する。
+
+    銘柄の時価総額が全体の stock_cap_ratio（4%）以下で、
+    そのセクターの時価総額が全体の sector_cap_ratio（20%）未満の候補のうち、先頭を返す。
+    df_stocks / df_latest_holdings には構築済みの CandidateIndex / HoldingWeights も渡せる。
     """
-    df_yield = df_stocks.head(20)
-    df_yield = df_yield.drop_duplicates(subset=["証券コード"], keep="first")
-    df_yield = df_yield.head(10)
-    duplicate_codes = df_stocks["証券コード"].value_counts()
-    duplicate_codes = duplicate_codes[duplicate_codes > 1]
-    df_duplicates = df_stocks[df_stocks["証券コード"].isin(duplicate_codes.index)]
-    df_duplicates = df_duplicates.drop_duplicates(subset=["証券コード"], keep="first")
-    temp_df = pd.concat([df_yield, df_duplicates], ignore_index=True)
-    temp_df = temp_df.drop(columns=["URL", "指数"])
-    temp_df = temp_df.drop_duplicates(subset=["証券コード"], keep="first")
-    total_cap = df_latest_holdings["時価総額"].sum()
-    for _, stock in temp_df.iterrows():
-        sector = stock["セクター"]
-        code = stock["証券コード"]
-        if str(code) in cut_codes:
-            continue
-        stock_cap = df_latest_holdings[
-            df_latest_holdings["証券コード"].astype(str) == str(code)
-        ]["時価総額"].sum()
-        if stock_cap > total_cap * 0.04:
-            continue
-        sector_stocks = df_latest_holdings[df_latest_holdings["セクター"] == sector]
-        sector_cap = sector_stocks["時価総額"].sum()
-        if sector_cap < total_cap * 0.2:
-            return stock
-    return None
+    index = _as_candidate_index(df_stocks)
+    rows = index.sector_candidate_rows
+    if not rows:
+        return None
+    weights = _as_holding_weights(df_latest_holdings)
+    total_cap = weights.total_cap
+
+    stock_caps = np.array([weights.code_caps.get(code, 0) for code, _, _ in rows])
+    sector_caps = np.array(
+        [weights.sector_caps.get(sector, 0) for _, sector, _ in rows]
+    )
+    not_cut = np.array([code not in cut_codes for code, _, _ in rows])
+    eligible = (
+        not_cut
+        & (stock_caps <= total_cap * stock_cap_ratio)
+        & (sector_caps < total_cap * sector_cap_ratio)
+    )
+    if not eligible.any():
+        return None
+    return index.df_sector_candidates.iloc[rows[int(eligible.argmax())][2]]
 
 
-def select_stock(df_stocks, df_latest_holdings, held_sector, cut_codes=frozenset()):
+def select_stock(
+    df_stocks,
+    df_latest_holdings,
+    held_sector,
+    cut_codes=frozenset(),
+    stock_cap_ratio=STOCK_CAP_RATIO,
+    sector_cap_ratio=SECTOR_CAP_RATIO,
+):
     """
     銘柄選定のメイン処理。
     cut_codes に含まれる証券コード（来期減配予想）は全段階で除外する。
+    df_stocks / df_latest_holdings には構築済みの CandidateIndex / HoldingWeights も渡せる。
+    stock_cap_ratio / sector_cap_ratio は pick_stock_in_holding_sector の上限。
     """
+    df_stocks = _as_candidate_index(df_stocks)
+
     # 配当利回り上位10銘柄から選定
     stock = pick_stock_by_yield(df_stocks, held_sector, cut_codes)
     if stock is not None:
@@ -107,25 +226,40 @@ def select_stock(df_stocks, df_latest_holdings, held_sector, cut_codes=frozenset
         return stock
 
     # 保有済みセクターから高配当銘柄を選定
-    stock = pick_stock_in_holding_sector(df_stocks, df_latest_holdings, cut_codes)
+    stock = pick_stock_in_holding_sector(
+        df_stocks, df_latest_holdings, cut_codes, stock_cap_ratio, sector_cap_ratio
+    )
     if stock is not None:
         return stock
 
     return None
 
 
-def select_stocks(df_stocks, df_latest_holdings, held_sector,
-                  cut_codes=frozenset(), n=2):
+def select_stocks(
+    df_stocks,
+    df_latest_holdings,
+    held_sector,
+    cut_codes=frozenset(),
+    n=PICKS_PER_WEEK,
+    stock_cap_ratio=STOCK_CAP_RATIO,
+    sector_cap_ratio=SECTOR_CAP_RATIO,
+):
     """
     select_stock を反復適用して最大 n 銘柄を選定する。
     各回で選定済みコードを除外集合に、選定済みセクターを保有済みセクターに加え、
     別セクター優先・コード重複回避を既存ロジックのまま実現する。
+    候補の索引（CandidateIndex）と保有の集計（HoldingWeights）は最初に一度だけ作り、
+    各回で使い回す（上位の窓を変えるときは CandidateIndex を渡す）。
     """
+    candidates = _as_candidate_index(df_stocks)
+    weights = _as_holding_weights(df_latest_holdings)
     picked = []
     held = set(held_sector)
     excluded = set(cut_codes)
     for _ in range(n):
-        stock = select_stock(df_stocks, df_latest_holdings, held, excluded)
+        stock = select_stock(
+            candidates, weights, held, excluded, stock_cap_ratio, sector_cap_ratio
+        )
         if stock is None:
             break
         picked.append(stock)
@@ -0,0 +1,156 @@
+"""選定パラメータのグリッドを過去スナップショットで一括評価するスイープ。
+
+stock_selector の上限（1銘柄4%・セクター20%）、上位の窓（20→10）、毎週の銘柄数、
+1銘柄あたりの購入額の組み合わせごとに backtest.run_backtest を回し、
+backtest.summarize の要約を並べた順位表を返す。
+
+組み合わせはプロセスプールで並列に評価する。スナップショットはプールを作る前に
+親プロセスで一度だけ読み込んでモジュール変数に置くので、fork で起動した子プロセスは
+それをそのまま（コピーオンライトで）参照し、タスクごとに pickle して送ることはない。
+fork が使えない環境では、子プロセスの initializer が起動時に一度だけ読み込む。
+
+使い方:
+  python sweep.py                                   # DEFAULT_GRID を SNAPSHOT_DIR で評価
+  python sweep.py --stock-cap 0.03,0.04 --sector-cap 0.2,0.25 --n 1,2,3
+  python sweep.py --workers 4 --rank-by 最大セクター比率 --ascending --out sweep.csv
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from backtest import SNAPSHOT_DIR, load_snapshots, run_backtest, summarize
+from stock_selector import (
+    HEAD_WINDOW,
+    LOT_YEN,
+    PICKS_PER_WEEK,
+    SECTOR_CAP_RATIO,
+    STOCK_CAP_RATIO,
+    TOP_N,
+)
+
+# 評価する組み合わせ（キーは run_backtest の引数名）
+DEFAULT_GRID = {
+    "stock_cap_ratio": [0.03, STOCK_CAP_RATIO, 0.05],
+    "sector_cap_ratio": [0.15, SECTOR_CAP_RATIO, 0.25],
+    "head_window": [HEAD_WINDOW],
+    "top_n": [TOP_N],
+    "n": [1, PICKS_PER_WEEK, 3],
+    "lot": [LOT_YEN],
+}
+RANK_BY = "総リターン率"
+
+# 子プロセスが参照する読み取り専用のスナップショット（親で読み込むか initializer で読む）
+_SNAPSHOTS = None
+
+
+def expand_grid(grid):
+    """{引数名: 候補のリスト} から全組み合わせの辞書のリストを作る。"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def _init_worker(directory):
+    global _SNAPSHOTS
+    if _SNAPSHOTS is None:
+        _SNAPSHOTS = load_snapshots(directory)
+
+
+def _evaluate(params):
+    df_path, df_trades = run_backtest(_SNAPSHOTS, **params)
+    result = dict(params)
+    result.update(summarize(df_path))
+    result["購入回数"] = len(df_trades)
+    return result
+
+
+def run_sweep(grid=None, directory=SNAPSHOT_DIR, workers=None, rank_by=RANK_BY,
+              ascending=False):
+    """
+    パラメータの全組み合わせをプロセスプールで評価し、順位表を返す。
+
+    Args:
+        grid (dict): {run_backtest の引数名: 候補のリスト}（省略時は DEFAULT_GRID）
+        directory (str): スナップショットのディレクトリ
+        workers (int): プロセス数（省略時は CPU 数）
+        rank_by (str): 並べ替えに使う要約の列
+        ascending (bool): 小さい順に並べるか
+
+    Returns:
+        pd.DataFrame: 1行1組み合わせの順位表（順位は1始まりのインデックス）。
+            スナップショットが無ければ空。
+    """
+    global _SNAPSHOTS
+    _SNAPSHOTS = load_snapshots(directory)
+    if not _SNAPSHOTS:
+        return pd.DataFrame()
+
+    combos = expand_grid(grid or DEFAULT_GRID)
+    workers = min(workers or os.cpu_count() or 1, len(combos))
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(directory,),
+    ) as executor:
+        chunksize = max(1, len(combos) // (workers * 4))
+        results = list(executor.map(_evaluate, combos, chunksize=chunksize))
+
+    df = pd.DataFrame(results)
+    df = df.sort_values(rank_by, ascending=ascending, kind="stable")
+    df.index = range(1, len(df) + 1)
+    df.index.name = "順位"
+    return df
+
+
+def _parse_list(text, cast):
+    return [cast(value) for value in text.split(",") if value]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshots", default=SNAPSHOT_DIR)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--stock-cap", help="1銘柄の上限（カンマ区切り）")
+    parser.add_argument("--sector-cap", help="セクターの上限（カンマ区切り）")
+    parser.add_argument("--head-window", help="利回り上位から見る行数（カンマ区切り）")
+    parser.add_argument("--top-n", help="重複排除後に残す銘柄数（カンマ区切り）")
+    parser.add_argument("--n", help="毎週選ぶ銘柄数（カンマ区切り）")
+    parser.add_argument("--lot", help="1銘柄あたりの購入額（カンマ区切り）")
+    parser.add_argument("--rank-by", default=RANK_BY)
+    parser.add_argument("--ascending", action="store_true")
+    parser.add_argument("--top", type=int, default=20, help="表示する上位の件数")
+    parser.add_argument("--out", help="順位表の保存先CSV")
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    for key, text, cast in (
+        ("stock_cap_ratio", args.stock_cap, float),
+        ("sector_cap_ratio", args.sector_cap, float),
+        ("head_window", args.head_window, int),
+        ("top_n", args.top_n, int),
+        ("n", args.n, int),
+        ("lot", args.lot, int),
+    ):
+        if text:
+            grid[key] = _parse_list(text, cast)
+
+    df = run_sweep(grid, args.snapshots, args.workers, args.rank_by, args.ascending)
+    if df.empty:
+        print(f"[error] スナップショットがありません: {args.snapshots}")
+        return
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(df.head(args.top).to_string())
+    if args.out:
+        df.to_csv(args.out, encoding="utf-8-sig")
+        print(f"{len(df)} 件の結果を {args.out} に保存しました。")
+
+
+if __name__ == "__main__":
+    main()
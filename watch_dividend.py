@@ -1,80 +1,169 @@
 import logging
-import re
+import threading
 from datetime import datetime, timedelta
-from time import sleep
 
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 
-from get_high_dividend_stock_code import get_high_dividend_stock_codes, setup_driver
+from company_page import extract_company_quote
+from http_cache import HttpCache
+from http_fetcher import RateLimitedFetcher
+
+
+QUOTE_BASE_URL = "https://www.nikkei.com/nkd/company/?scode="
+QUOTE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    "Accept-Language": "ja-JP,ja;q=0.9",
+    "Referer": "https://www.nikkei.com/",
+}
+# nikkei.com へのアクセス頻度。旧実装の「1件ごとに sleep(2)」の代わりに
+# ホスト単位のトークンバケットで毎秒のリクエスト数を制限し、その範囲で並列に取る。
+QUOTE_RATE = 1.0  # 毎秒リクエスト数
+QUOTE_BURST = 1
+QUOTE_MAX_WORKERS = 4  # 同時接続数の上限
+
+
+def create_quote_fetcher(
+    rate=QUOTE_RATE,
+    burst=QUOTE_BURST,
+    max_workers=QUOTE_MAX_WORKERS,
+    use_cache=True,
+    cache_bypass=None,
+):
+    """
+    nikkei.com 用のレート制限付き取得器を作る。
 
-logging.basicConfig(level=logging.ERROR, filename="error.log")
+    use_cache=True なら会社ページをローカルキャッシュ（次の大引けまで有効）に保存し、
+    同日の再実行では取り直さない。cache_bypass=True ならキャッシュを読まずに取り直す
+    （None なら環境変数 HTTP_CACHE_BYPASS に従う）。
+    """
+    cache = HttpCache(bypass=cache_bypass) if use_cache else None
+    return RateLimitedFetcher(
+        rate=rate,
+        burst=burst,
+        max_workers=max_workers,
+        headers=QUOTE_HEADERS,
+        cache=cache,
+    )
 
 
-def calculate_dividend_yield(codes, sector_dict):
+def _parse_company_page(code, url, html, sector_dict):
+    """
+    会社ページのHTMLから会社名・株価・配当利回りを取り出し、1行分の辞書を返す。
+    """
+    quote = extract_company_quote(html)
+    company_name = quote.company_name
+
+    if company_name is None:
+        print(f"{code}の会社名の取得に失敗しました。")
+        print(url)
+
+    today = datetime.now().strftime("%Y-%m-%d")
+    if quote.stock_price is None:
+        logging.error(
+            f"{today}:{code} {company_name} 株価を取得できません: {quote.price_text}"
+        )
+    if quote.dividend_yield is None:
+        logging.error(
+            f"{today}:{code} {company_name} 配当利回りを取得できません: {quote.yield_text}"
+        )
+
+    sector = sector_dict.get(code, "Unknown")
+    return {
+        "証券コード": code,
+        "セクター": sector,
+        "配当利回り(%)": quote.dividend_yield,
+        "会社名": company_name,
+        "株価": quote.stock_price,
+        "URL": url,
+    }
+
+
+class QuoteRegistry:
+    """
+    1回の実行内で、会社ページを証券コード（URL）ごとに1度だけ取得して使い回す台帳。
+
+    複数指数に重複する銘柄や、保有銘柄と指数構成銘柄の重複があっても
+    HTTP リクエストは一意なコードの数だけで済む。セクターは呼び出し元ごとに
+    違う辞書を使うため、台帳にはセクター以外の項目だけを持たせる。
+
+    保有銘柄側と指数側のように複数のスレッドから同時に prefetch しても、
+    取得中のURLは取得中の印（Event）を待つだけで二重には取らない。
+    """
+
+    def __init__(self, fetcher=None):
+        self.fetcher = fetcher if fetcher is not None else create_quote_fetcher()
+        self._records = {}
+        self._inflight = {}  # 取得中の URL → 取得完了の Event
+        self._lock = threading.Lock()
+
+    def prefetch(self, codes):
+        """未取得のコードだけをまとめて並列に取得し、台帳に登録する。"""
+        pending = {}
+        waiting = []
+        with self._lock:
+            for code in codes:
+                url = QUOTE_BASE_URL + str(code)
+                if url in self._records or url in pending:
+                    continue
+                event = self._inflight.get(url)
+                if event is not None:
+                    # 別のスレッドが取得中なので、それを待つ
+                    waiting.append(event)
+                    continue
+                pending[url] = code
+                self._inflight[url] = threading.Event()
+        try:
+            if pending:
+                responses = self.fetcher.fetch_many(list(pending))
+                records = {
+                    url: _parse_company_page(code, url, responce.text, {})
+                    for (url, code), responce in zip(pending.items(), responses)
+                }
+                with self._lock:
+                    self._records.update(records)
+        finally:
+            with self._lock:
+                for url in pending:
+                    self._inflight.pop(url).set()
+        for event in waiting:
+            event.wait()
+
+    def get_records(self, codes, sector_dict):
+        """codes と同じ順番で1行分の辞書のリストを返す（未取得分はここで取得する）。"""
+        self.prefetch(codes)
+        with self._lock:
+            missing = [
+                code for code in codes if QUOTE_BASE_URL + str(code) not in self._records
+            ]
+        if missing:
+            # 待っていた別スレッドの取得が失敗した分は、ここで取り直す
+            self.prefetch(missing)
+        data = []
+        for code in codes:
+            record = dict(self._records[QUOTE_BASE_URL + str(code)])
+            record["証券コード"] = code
+            record["セクター"] = sector_dict.get(code, "Unknown")
+            data.append(record)
+        return data
+
+
+def calculate_dividend_yield(codes, sector_dict, fetcher=None, registry=None):
     """
     指定された証券コードリストに対して配当利回りを計算し、結果を出力する。
 
+    会社ページはレート制限付きで並列に取得する（fetcher の rate / max_workers 次第）。
+    registry を渡すと、同じ実行内で取得済みのコードは再取得しない。
+
     Args:
         codes (list): 証券コードのリスト
         sector_dict (dict): 証券コードとセクターの対応辞書
+        fetcher (RateLimitedFetcher): 取得器。省略時は既定レートで新規作成する
+        registry (QuoteRegistry): 実行内で共有する取得済みページの台帳
     """
-    base_url = "https://www.nikkei.com/nkd/company/?scode="
-    data = []
-
-    session = requests.Session()
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-        "Accept-Language": "ja-JP,ja;q=0.9",
-        "Referer": "https://www.nikkei.com/",
-    }
+    if registry is None:
+        registry = QuoteRegistry(fetcher)
 
-    for code in codes:
-        url = base_url + str(code)
-        responce = session.get(url, headers=headers)
-        soup = BeautifulSoup(responce.text, "html.parser")
-
-        try:
-            company_name = soup.select_one("h1.m-headlineLarge_text").text
-        except AttributeError:
-            print(f"{code}の会社名の取得に失敗しました。")
-            print(url)
-
-        stock_price = soup.select_one("dd.m-stockPriceElm_value").text
-        try:
-            stock_price = float(
-                re.search(r"[\d,]+", stock_price).group().replace(",", "")
-            )
-        except AttributeError as e:
-            today = datetime.now().strftime("%Y-%m-%d")
-            logging.error(f"{today}:{code} {company_name} {e}")
-            stock_price = None
-        dividend = soup.select_one(
-            "div.m-stockInfo_detail_right li:nth-child(3) span.m-stockInfo_detail_value"
-        ).text
-        try:
-            dividend_yield = float(re.search(r"(\d+(\.\d+)?)", dividend).group())
-        except AttributeError as e:
-            today = datetime.now().strftime("%Y-%m-%d")
-            logging.error(f"{today}:{code} {company_name} {e}")
-            dividend_yield = None
-
-        sector = sector_dict.get(code, "Unknown")
-        data.append(
-            {
-                "証券コード": code,
-                "セクター": sector,
-                "配当利回り(%)": dividend_yield,
-                "会社名": company_name,
-                "株価": stock_price,
-                "URL": url,
-            }
-        )
-        sleep(2)
+    data = registry.get_records(codes, sector_dict)
 
     df = pd.DataFrame(data)
     df = df.sort_values(by="配当利回り(%)", ascending=False)
@@ -82,7 +171,8 @@ def calculate_dividend_yield(codes, sector_dict):
 
 
 def create_latest_dividend_dataframe(
-    high_dividend_codes, progressive_codes, consecutive_codes, sector_dict
+    high_dividend_codes, progressive_codes, consecutive_codes, sector_dict,
+    registry=None,
 ):
     """
     最新の配当データを計算し、データフレームを返す。
@@ -92,17 +182,31 @@ def create_latest_dividend_dataframe(
         progressive_codes (list): 累進高配当株の証券コードリスト
         consecutive_codes (list): 連続増配株の証券コードリスト
         sector_dict (dict): 証券コードとセクターの対応辞書
+        registry (QuoteRegistry): 実行内で共有する取得済みページの台帳
 
     Returns:
         pd.DataFrame: 全ての配当利回りデータを含むデータフレーム
+        （指数ごとの行を持つため、重複銘柄は指数の数だけ行がある）
     """
-    df_high_dividend = calculate_dividend_yield(high_dividend_codes, sector_dict)
+    if registry is None:
+        registry = QuoteRegistry()
+
+    # 3指数の和集合を一度に取得しておき、重複銘柄の再取得を避ける
+    registry.prefetch(high_dividend_codes + progressive_codes + consecutive_codes)
+
+    df_high_dividend = calculate_dividend_yield(
+        high_dividend_codes, sector_dict, registry=registry
+    )
     df_high_dividend["指数"] = "日経平均高配当株50指数"
 
-    df_progressive = calculate_dividend_yield(progressive_codes, sector_dict)
+    df_progressive = calculate_dividend_yield(
+        progressive_codes, sector_dict, registry=registry
+    )
     df_progressive["指数"] = "日経累進高配当株指数"
 
-    df_consecutive = calculate_dividend_yield(consecutive_codes, sector_dict)
+    df_consecutive = calculate_dividend_yield(
+        consecutive_codes, sector_dict, registry=registry
+    )
     df_consecutive["指数"] = "日経連続増配株指数"
 
     df_all = pd.concat(
@@ -118,9 +222,23 @@ def create_latest_dividend_dataframe(
 
 
 if __name__ == "__main__":
+    import sys
+
+    from get_high_dividend_stock_code import get_high_dividend_stock_codes
+
+    logging.basicConfig(level=logging.ERROR, filename="error.log")
+
+    # --no-cache: ローカルキャッシュを読まずに全ページを取り直す
+    registry = QuoteRegistry(
+        create_quote_fetcher(cache_bypass=True if "--no-cache" in sys.argv else None)
+    )
     high_dividend_codes, progressive_codes, consecutive_codes, sector_dict = (
         get_high_dividend_stock_codes()
     )
     create_latest_dividend_dataframe(
-        high_dividend_codes, progressive_codes, consecutive_codes, sector_dict
+        high_dividend_codes,
+        progressive_codes,
+        consecutive_codes,
+        sector_dict,
+        registry=registry,
     )